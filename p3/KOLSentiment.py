@@ -1,10 +1,13 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Index
+from sqlalchemy import Column, Integer, String, Float, DateTime, Index, bindparam, func, select
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, validates
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 import yfinance as yf
 import pandas as pd
-from yfinance_helper import YFinanceHelper
+from yfinance_helper import YFinanceHelper, nearest_close
+from sqlite_config import create_sqlite_engine
+from kol_accuracy import RETURN_DTYPES, build_kol_performance_stats, build_sentiment_accuracy_stats, direction_correct_sql
 
 Base = declarative_base()
 
@@ -34,15 +37,72 @@ class KOLSentiment(Base):
         Index('idx_kol_name', 'kol_name'),
         Index('idx_ticker', 'ticker'),
         Index('idx_sector', 'sector'),
+        # Composite indexes serve "WHERE col = ? ORDER BY prediction_time DESC" without a sort
+        Index('idx_kol_time', 'kol_name', 'prediction_time'),
+        Index('idx_ticker_time', 'ticker', 'prediction_time'),
+        # Partial index over the rows that already have returns
+        Index('idx_has_returns', 'prediction_time', sqlite_where=return_1d.isnot(None)),
     )
+    
+    @validates('sentiment')
+    def _lowercase_sentiment(self, key, value):
+        """Store sentiment lowercased so accuracy checks need no per-row .lower()"""
+        return value.lower() if value is not None else value
+
+# Query statements built once at import and executed with bound parameters
+_STMT_WITH_RETURNS = select(KOLSentiment).where(
+    KOLSentiment.return_1d.isnot(None)
+).order_by(KOLSentiment.prediction_time.desc())
+_STMT_RETURNS_COLUMNS = select(
+    KOLSentiment.kol_name, KOLSentiment.sentiment,
+    KOLSentiment.return_1d, KOLSentiment.return_3d, KOLSentiment.return_10d
+).where(KOLSentiment.return_1d.isnot(None))
+_STMT_RETURNS_VERSION = select(
+    func.count(), func.max(KOLSentiment.created_at)
+).where(KOLSentiment.return_1d.isnot(None))
+_STMT_BY_KOL = select(KOLSentiment).where(
+    KOLSentiment.kol_name == bindparam('kol_name')
+).order_by(KOLSentiment.prediction_time.desc())
+_STMT_BY_TICKER = select(KOLSentiment).where(
+    KOLSentiment.ticker == bindparam('ticker')
+).order_by(KOLSentiment.prediction_time.desc())
+_STMT_BY_SECTOR = select(KOLSentiment).where(
+    KOLSentiment.sector == bindparam('sector')
+).order_by(KOLSentiment.prediction_time.desc())
+_STMT_BY_DATE_RANGE = select(KOLSentiment).where(
+    KOLSentiment.prediction_time.between(bindparam('start_date'), bindparam('end_date'))
+).order_by(KOLSentiment.prediction_time.desc())
+
+# Columns supplied by insert_many; id and created_at come from the table defaults
+_INSERT_COLUMNS = (
+    'prediction_time', 'kol_name', 'ticker', 'sector', 'sentiment', 'confidence',
+    'initial_price', 'return_1d', 'return_3d', 'return_10d',
+)
+
+def _print_errors(errors, limit=20):
+    """Print collected per-record errors in one write, at most limit of them"""
+    if not errors:
+        return
+    lines = errors[:limit]
+    if len(errors) > limit:
+        lines.append(f"...and {len(errors) - limit} more")
+    print("\n".join(lines))
 
 class KOLSentimentDB:
     def __init__(self, db_path="kol_sentiment.db"):
         self.db_path = db_path
-        self.engine = create_engine(f'sqlite:///{db_path}')
+        self.engine = create_sqlite_engine(db_path)
         self.Session = sessionmaker(bind=self.engine)
         self.init_database()
         
+        # Bumped on every write through this instance; part of the returns frame cache key
+        self._data_version = 0
+        self._returns_frame_cache = None
+        
+        # ticker -> (start_date, end_date, DataFrame) price histories downloaded in bulk,
+        # consulted by get_stock_price / calculate_returns before going to yfinance
+        self._histories = {}
+        
         # 初始化yfinance助手工具
         self.yf_helper = YFinanceHelper(
             cache_dir="yfinance_cache",
@@ -53,9 +113,17 @@ class KOLSentimentDB:
     def init_database(self):
         """Initialize the database and create tables"""
         Base.metadata.create_all(self.engine)
+        # create_all skips indexes on tables that already exist, so add any new ones here
+        for index in KOLSentiment.__table__.indexes:
+            index.create(self.engine, checkfirst=True)
     
     def get_stock_price(self, ticker, date):
         """Get stock price for a specific date using YFinanceHelper"""
+        hist = self._prefetched_history(
+            ticker, (date - timedelta(days=5)).strftime('%Y-%m-%d'), (date + timedelta(days=5)).strftime('%Y-%m-%d')
+        )
+        if hist is not None:
+            return self._price_from_history(hist, date)
         try:
             price = self.yf_helper.get_stock_price_on_date(ticker, date)
             if price is not None:
@@ -74,35 +142,154 @@ class KOLSentimentDB:
             start_date = initial_date.strftime('%Y-%m-%d')
             end_date = (initial_date + timedelta(days=20)).strftime('%Y-%m-%d')
             
-            hist = self.yf_helper.get_stock_data(ticker, start_date, end_date)
+            hist = self._prefetched_history(ticker, start_date, end_date)
+            if hist is None:
+                hist = self.yf_helper.get_stock_data(ticker, start_date, end_date)
             if hist is None or hist.empty:
                 print(f"${ticker}: 无法获取历史数据 ({start_date} 到 {end_date})")
                 return None, None, None
             
-            returns = {}
-            
-            # Calculate 1-day return
-            if len(hist) > 1:
-                price_1d = hist['Close'].iloc[1]
-                returns['1d'] = (price_1d - initial_price) / initial_price
-                print(f"Return 1d: {returns['1d']}, Return 3d: {returns.get('3d', 'N/A')}, Return 10d: {returns.get('10d', 'N/A')}")
-            
-            # Calculate 3-day return
-            if len(hist) > 3:
-                price_3d = hist['Close'].iloc[3]
-                returns['3d'] = (price_3d - initial_price) / initial_price
-            
-            # Calculate 10-day return
-            if len(hist) > 10:
-                price_10d = hist['Close'].iloc[10]
-                returns['10d'] = (price_10d - initial_price) / initial_price
-            
-            return returns.get('1d'), returns.get('3d'), returns.get('10d')
+            return_1d, return_3d, return_10d = self._returns_from_history(hist, initial_date, initial_price)
+            print(f"Return 1d: {return_1d}, Return 3d: {return_3d}, Return 10d: {return_10d}")
+            return return_1d, return_3d, return_10d
             
         except Exception as e:
             print(f"Error calculating returns for {ticker}: {e}")
             return None, None, None
     
+    def calculate_returns_bulk(self, records, batch_size=20, histories=None):
+        """
+        Calculate 1, 3, and 10 day returns for many records at once
+        
+        Records are grouped by ticker and downloaded in batches of up to
+        batch_size symbols per yf.download call, covering the whole date span
+        of the records, instead of one download per record.
+        
+        Args:
+            records: Iterable of objects with ticker, prediction_time and initial_price
+            batch_size: Maximum number of tickers per download request
+            histories: Already downloaded ticker -> price history dict, skips the download
+        
+        Returns:
+            list: (return_1d, return_3d, return_10d) tuples aligned with records
+        """
+        records = list(records)
+        if not records:
+            return []
+        
+        if histories is None:
+            histories = self.prefetch_histories(((r.ticker, r.prediction_time) for r in records), batch_size)
+        
+        results = []
+        errors = []
+        for record in records:
+            hist = histories.get(record.ticker)
+            if hist is None or hist.empty or record.initial_price is None:
+                results.append((None, None, None))
+                continue
+            try:
+                results.append(self._returns_from_history(hist, record.prediction_time, record.initial_price))
+            except Exception as e:
+                errors.append(f"Error calculating returns for {record.ticker}: {e}")
+                results.append((None, None, None))
+        _print_errors(errors)
+        return results
+    
+    def prefetch_histories(self, pairs, batch_size=20):
+        """
+        Download price histories once for many (ticker, prediction_time) pairs
+        
+        Each distinct ticker is fetched a single time over a window from 5 days
+        before the earliest prediction to 20 days after the latest, enough for
+        both the initial price lookup and the 1/3/10 day returns. The histories
+        are kept on the instance, so later get_stock_price / calculate_returns
+        calls inside that window do not hit yfinance again.
+        
+        Args:
+            pairs: Iterable of (ticker, prediction_time) tuples
+            batch_size: Maximum number of tickers per download request
+        
+        Returns:
+            dict: Ticker to price history DataFrame for the requested tickers
+        """
+        pairs = list(pairs)
+        if not pairs:
+            return {}
+        
+        start_date = (min(t for _, t in pairs) - timedelta(days=5)).strftime('%Y-%m-%d')
+        end_date = (max(t for _, t in pairs) + timedelta(days=20)).strftime('%Y-%m-%d')
+        tickers = sorted({ticker for ticker, _ in pairs})
+        
+        missing = [t for t in tickers if self._prefetched_history(t, start_date, end_date) is None]
+        if missing:
+            fetched = self._fetch_histories(missing, start_date, end_date, batch_size)
+            for ticker, hist in fetched.items():
+                if hist is not None and not hist.empty:
+                    self._histories[ticker] = (start_date, end_date, hist)
+        
+        return {t: self._histories[t][2] for t in tickers if t in self._histories}
+    
+    def _prefetched_history(self, ticker, start_date, end_date):
+        """Prefetched history for ticker if it covers [start_date, end_date], otherwise None"""
+        entry = self._histories.get(ticker)
+        if entry is None or entry[0] > start_date or entry[1] < end_date:
+            return None
+        return entry[2]
+    
+    def _fetch_histories(self, tickers, start_date, end_date, batch_size, max_concurrency=5):
+        """
+        Download ticker batches concurrently
+        
+        Each batch is a blocking YFinanceHelper call run on a thread pool, with
+        at most max_concurrency batches in flight at a time. A plain thread pool
+        (rather than asyncio.run) keeps this usable from a running event loop,
+        e.g. in Jupyter or an async caller.
+        
+        Returns:
+            dict: Ticker to price history DataFrame
+        """
+        def fetch_batch(batch):
+            return self.yf_helper.batch_get_stock_data(
+                batch, start_date, end_date,
+                batch_size=len(batch),
+                use_bulk_download=True
+            )
+        
+        batches = [tickers[i:i + batch_size] for i in range(0, len(tickers), batch_size)]
+        histories = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(batches)))) as executor:
+            for result in executor.map(fetch_batch, batches):
+                histories.update(result)
+        return histories
+    
+    @staticmethod
+    def _returns_from_history(hist, initial_date, initial_price):
+        """Pick the closes 1, 3 and 10 trading days after initial_date from a price history"""
+        close = hist['Close']
+        if isinstance(close, pd.DataFrame):
+            close = close.iloc[:, 0]
+        close = close.dropna()
+        
+        target = pd.Timestamp(initial_date.date())
+        if close.index.tz is not None:
+            target = target.tz_localize(close.index.tz)
+        # First bar on or after the prediction date, as in the single-record window
+        base = close.index.searchsorted(target)
+        
+        returns = []
+        for offset in (1, 3, 10):
+            pos = base + offset
+            if pos < len(close):
+                returns.append((float(close.iloc[pos]) - initial_price) / initial_price)
+            else:
+                returns.append(None)
+        return tuple(returns)
+    
+    @staticmethod
+    def _price_from_history(hist, target_date, days_buffer=5):
+        """Close on target_date, or the nearest close within days_buffer days (same rule as get_stock_price_on_date)"""
+        return nearest_close(hist, target_date, days_buffer)
+    
     def insert_record_with_returns(self, kol_name, ticker, sector, sentiment, confidence, prediction_time=None):
         """Insert a new record with price and return calculations"""
         if prediction_time is None:
@@ -123,33 +310,95 @@ class KOLSentimentDB:
             )
             # Calculate returns if we have initial price
             if initial_price is not None:
+                # calculate_returns already prints the returns
                 return_1d, return_3d, return_10d = self.calculate_returns(ticker, prediction_time, initial_price)
-                print(f"Return 1d: {return_1d}, Return 3d: {return_3d}, Return 10d: {return_10d}")
                 record.return_1d = return_1d
                 record.return_3d = return_3d
                 record.return_10d = return_10d
-                session.add(record)
-                session.commit()
+            session.add(record)
+            session.commit()
+            self._data_version += 1
             return record.id
         finally:
             session.close()
     
+    def insert_many(self, rows, batch_size=20, insert_chunk_size=1000):
+        """
+        Insert many records with prices and returns in a single transaction
+        
+        Price histories are downloaded once per ticker for the whole batch
+        (see prefetch_histories). Rows are written with executemany-style Core
+        inserts of insert_chunk_size rows, all committed together.
+        
+        Args:
+            rows: Iterable of (kol_name, ticker, sector, sentiment, confidence[, prediction_time]) tuples
+            batch_size: Maximum number of tickers per download request
+            insert_chunk_size: Rows per executemany insert
+        
+        Returns:
+            int: Number of records inserted
+        """
+        now = datetime.now()
+        records = []
+        for row in rows:
+            kol_name, ticker, sector, sentiment, confidence = row[:5]
+            prediction_time = row[5] if len(row) > 5 and row[5] is not None else now
+            records.append(KOLSentiment(
+                prediction_time=prediction_time,
+                kol_name=kol_name,
+                ticker=ticker,
+                sector=sector,
+                sentiment=sentiment,
+                confidence=confidence
+            ))
+        if not records:
+            return 0
+        
+        histories = self.prefetch_histories(((r.ticker, r.prediction_time) for r in records), batch_size)
+        for record in records:
+            hist = histories.get(record.ticker)
+            if hist is not None and not hist.empty:
+                record.initial_price = self._price_from_history(hist, record.prediction_time)
+        
+        returns = self.calculate_returns_bulk(records, batch_size, histories=histories)
+        for record, (return_1d, return_3d, return_10d) in zip(records, returns):
+            record.return_1d = return_1d
+            record.return_3d = return_3d
+            record.return_10d = return_10d
+        
+        # Plain parameter dicts; the records above are never attached to a session.
+        # Sentiment was already lowercased by the model validator on construction.
+        params = [{column: getattr(record, column) for column in _INSERT_COLUMNS} for record in records]
+        
+        session = self.Session()
+        try:
+            insert_stmt = KOLSentiment.__table__.insert()
+            for i in range(0, len(params), insert_chunk_size):
+                session.execute(insert_stmt, params[i:i + insert_chunk_size])
+            session.commit()
+            self._data_version += 1
+            return len(params)
+        finally:
+            session.close()
+    
     def update_returns_for_existing_records(self):
         """Update returns for records that don't have return data yet"""
         session = self.Session()
         try:
-            records = session.query(KOLSentiment).filter(
-                KOLSentiment.return_1d.isnot(None)
+            records = session.query(
+                KOLSentiment.id, KOLSentiment.ticker,
+                KOLSentiment.prediction_time, KOLSentiment.initial_price
+            ).filter(
+                KOLSentiment.return_1d.is_(None),
+                KOLSentiment.initial_price.isnot(None)
             ).all()
-            for record in records:
-                if record.initial_price is not None:
-                    return_1d, return_3d, return_10d = self.calculate_returns(
-                        record.ticker, record.prediction_time, record.initial_price
-                    )
-                    record.return_1d = return_1d
-                    record.return_3d = return_3d
-                    record.return_10d = return_10d
+            returns = self.calculate_returns_bulk(records)
+            session.bulk_update_mappings(KOLSentiment, [
+                {'id': record.id, 'return_1d': return_1d, 'return_3d': return_3d, 'return_10d': return_10d}
+                for record, (return_1d, return_3d, return_10d) in zip(records, returns)
+            ])
             session.commit()
+            self._data_version += 1
         finally:
             session.close()
     
@@ -157,19 +406,42 @@ class KOLSentimentDB:
         """Get all records with return data"""
         session = self.Session()
         try:
-            return session.query(KOLSentiment).filter(
-                KOLSentiment.return_1d.isnot(None)
-            ).order_by(KOLSentiment.prediction_time.desc()).all()
+            return session.execute(_STMT_WITH_RETURNS).scalars().all()
         finally:
             session.close()
     
+    def get_returns_frame(self):
+        """
+        Get the columns used by the performance metrics for all records with return data
+        
+        Only kol_name, sentiment and the three return columns are selected, straight
+        into a DataFrame. The frame is cached until records are written through this
+        instance or the row count / latest created_at changes; treat it as read-only.
+        
+        Returns:
+            pd.DataFrame: kol_name, sentiment, return_1d, return_3d, return_10d
+        """
+        session = self.Session()
+        try:
+            count, latest = session.execute(_STMT_RETURNS_VERSION).one()
+        finally:
+            session.close()
+        
+        version = (self._data_version, count, latest)
+        if self._returns_frame_cache is not None and self._returns_frame_cache[0] == version:
+            return self._returns_frame_cache[1]
+        
+        df = pd.read_sql(_STMT_RETURNS_COLUMNS, self.engine)
+        # Downcast returns to float32 (all-NULL columns come back as object dtype)
+        df = df.astype(RETURN_DTYPES)
+        self._returns_frame_cache = (version, df)
+        return df
+    
     def get_records_by_kol(self, kol_name):
         """Get records by KOL name"""
         session = self.Session()
         try:
-            return session.query(KOLSentiment).filter(
-                KOLSentiment.kol_name == kol_name
-            ).order_by(KOLSentiment.prediction_time.desc()).all()
+            return session.execute(_STMT_BY_KOL, {'kol_name': kol_name}).scalars().all()
         finally:
             session.close()
     
@@ -177,9 +449,7 @@ class KOLSentimentDB:
         """Get records by ticker"""
         session = self.Session()
         try:
-            return session.query(KOLSentiment).filter(
-                KOLSentiment.ticker == ticker
-            ).order_by(KOLSentiment.prediction_time.desc()).all()
+            return session.execute(_STMT_BY_TICKER, {'ticker': ticker}).scalars().all()
         finally:
             session.close()
     
@@ -187,9 +457,7 @@ class KOLSentimentDB:
         """Get records by sector"""
         session = self.Session()
         try:
-            return session.query(KOLSentiment).filter(
-                KOLSentiment.sector == sector
-            ).order_by(KOLSentiment.prediction_time.desc()).all()
+            return session.execute(_STMT_BY_SECTOR, {'sector': sector}).scalars().all()
         finally:
             session.close()
     
@@ -197,12 +465,36 @@ class KOLSentimentDB:
         """Get records by date range"""
         session = self.Session()
         try:
-            return session.query(KOLSentiment).filter(
-                KOLSentiment.prediction_time.between(start_date, end_date)
-            ).order_by(KOLSentiment.prediction_time.desc()).all()
+            return session.execute(
+                _STMT_BY_DATE_RANGE, {'start_date': start_date, 'end_date': end_date}
+            ).scalars().all()
         finally:
             session.close()
     
+    def _accuracy_counts(self, group_column):
+        """Run one grouped query returning (group, total, correct_1d, correct_3d, correct_10d) rows"""
+        session = self.Session()
+        try:
+            return session.query(
+                group_column,
+                func.count(),
+                func.sum(direction_correct_sql(KOLSentiment.sentiment, KOLSentiment.return_1d)),
+                func.sum(direction_correct_sql(KOLSentiment.sentiment, KOLSentiment.return_3d)),
+                func.sum(direction_correct_sql(KOLSentiment.sentiment, KOLSentiment.return_10d))
+            ).filter(
+                KOLSentiment.return_1d.isnot(None)
+            ).group_by(group_column).all()
+        finally:
+            session.close()
+    
+    def get_kol_performance_stats(self):
+        """Get per-KOL direction accuracy, aggregated in SQL (same shape as kol_accuracy.get_kol_performance_stats)"""
+        return build_kol_performance_stats(self._accuracy_counts(KOLSentiment.kol_name))
+    
+    def get_sentiment_accuracy(self):
+        """Get accuracy by sentiment type, aggregated in SQL (same shape as kol_accuracy.analyze_sentiment_accuracy)"""
+        return build_sentiment_accuracy_stats(self._accuracy_counts(func.lower(KOLSentiment.sentiment)))
+    
     def update_record(self, record_id, **kwargs):
         """Update a record by ID"""
         session = self.Session()
@@ -213,6 +505,7 @@ class KOLSentimentDB:
                     if hasattr(record, key):
                         setattr(record, key, value)
                 session.commit()
+                self._data_version += 1
                 return True
             return False
         finally:
@@ -226,6 +519,7 @@ class KOLSentimentDB:
             if record:
                 session.delete(record)
                 session.commit()
+                self._data_version += 1
                 return True
             return False
         finally:
@@ -1,22 +1,99 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import and_, case, func
+
+RETURN_COLUMNS = ['return_1d', 'return_3d', 'return_10d']
+CORRECT_COLUMNS = ['correct_1d', 'correct_3d', 'correct_10d']
+PERIODS = ['1d', '3d', '10d']
+# Returns are small fractions; float32 halves memory traffic in the metrics pipeline
+RETURN_DTYPES = {column: 'float32' for column in RETURN_COLUMNS}
+# Interned once; every path lowercases the input sentiment once before comparing against these
+_POS, _NEG, _NEU = 'positive', 'negative', 'neutral'
+SENTIMENTS = [_POS, _NEG, _NEU]
+
 def is_direction_correct(sentiment, ret):
     """
     Check if the KOL sentiment prediction direction is correct based on actual returns
     
     Args:
-        sentiment (str): KOL sentiment prediction ("positive", "negative", "neutral")
+        sentiment (str): KOL sentiment prediction ("positive", "negative", "neutral", any case)
         ret (float): Actual return value
     
     Returns:
         int: 1 if prediction is correct, 0 if incorrect
     """
-    if sentiment.lower() == "positive" and ret > 0:
-        return 1
-    elif sentiment.lower() == "negative" and ret < 0:
-        return 1
-    elif sentiment.lower() == "neutral" and abs(ret) < 0.01:  # Consider neutral if return is very small
-        return 1
-    else:
-        return 0
+    # Case-insensitive like direction_correct_vec / direction_correct_sql; one .lower() per call
+    sentiment = sentiment.lower()
+    # At most one term can be true, so the sum is 0 or 1 with no branching
+    return int((sentiment == _POS) * (ret > 0)
+               + (sentiment == _NEG) * (ret < 0)
+               + (sentiment == _NEU) * (abs(ret) < 0.01))  # Consider neutral if return is very small
+
+def direction_correct_vec(sentiments, returns):
+    """
+    Vectorized version of is_direction_correct over whole columns
+    
+    Args:
+        sentiments (array-like): KOL sentiment predictions
+        returns (array-like): Actual return values (missing values as NaN/None)
+    
+    Returns:
+        np.ndarray: int8 array with 1 where the prediction is correct, 0 otherwise
+    """
+    sentiments = pd.Series(sentiments, dtype='object').str.lower().to_numpy()
+    returns = np.asarray(returns)
+    if returns.dtype.kind != 'f':
+        returns = returns.astype(np.float64)
+    correct = (((sentiments == "positive") & (returns > 0)) |
+               ((sentiments == "negative") & (returns < 0)) |
+               ((sentiments == "neutral") & (np.abs(returns) < 0.01)))
+    return correct.astype(np.int8)
+
+def direction_correct_sql(sentiment, ret):
+    """
+    SQL expression equivalent of is_direction_correct, for use in aggregate queries
+    
+    Args:
+        sentiment: Sentiment column expression
+        ret: Return column expression (NULL counts as incorrect)
+    
+    Returns:
+        SQLAlchemy CASE expression evaluating to 1 or 0
+    """
+    sentiment = func.lower(sentiment)
+    return case(
+        (and_(sentiment == "positive", ret > 0), 1),
+        (and_(sentiment == "negative", ret < 0), 1),
+        (and_(sentiment == "neutral", func.abs(ret) < 0.01), 1),
+        else_=0
+    )
+
+def records_to_frame(records):
+    """
+    Build a DataFrame with the columns needed for accuracy and performance metrics
+    
+    Args:
+        records: List of KOLSentiment records, or an existing DataFrame
+    
+    Returns:
+        pd.DataFrame: kol_name, sentiment and return_1d/3d/10d columns
+    """
+    if isinstance(records, pd.DataFrame):
+        return records
+    df = pd.DataFrame(
+        [(r.kol_name, r.sentiment, r.return_1d, r.return_3d, r.return_10d) for r in records],
+        columns=['kol_name', 'sentiment'] + RETURN_COLUMNS
+    )
+    return df.astype(RETURN_DTYPES)
+
+def _correctness_frame(records):
+    """Records with 1-day returns plus a correct_Nd column per time period"""
+    df = records_to_frame(records)
+    df = df[df['return_1d'].notna()].copy()
+    sentiments = df['sentiment'].to_numpy()
+    for return_column, correct_column in zip(RETURN_COLUMNS, CORRECT_COLUMNS):
+        df[correct_column] = direction_correct_vec(sentiments, df[return_column].to_numpy())
+    return df
 
 def calculate_accuracy_score(sentiment, ret_1d, ret_3d, ret_10d):
     """
@@ -39,6 +116,55 @@ def calculate_accuracy_score(sentiment, ret_1d, ret_3d, ret_10d):
     
     return accuracy_scores
 
+def _group_correct_counts(df, key):
+    """(key, total, correct_1d, correct_3d, correct_10d) tuples for each group of a correctness frame"""
+    grouped = df.groupby(key, sort=False)
+    totals = grouped.size()
+    correct = grouped[CORRECT_COLUMNS].sum()
+    return zip(totals.index, totals.to_numpy(), *(correct[column].to_numpy() for column in CORRECT_COLUMNS))
+
+def _stats_from_counts(counts, total_key):
+    """Shape (key, total, correct_1d, correct_3d, correct_10d) tuples into accuracy stats dicts"""
+    stats = {}
+    for key, total, *correct in counts:
+        entry = {total_key: int(total)}
+        for period, value in zip(PERIODS, correct):
+            entry[f'correct_{period}'] = int(value or 0)
+        # Calculate accuracy percentages
+        for period in PERIODS:
+            entry[f'accuracy_{period}'] = entry[f'correct_{period}'] / entry[total_key] if entry[total_key] > 0 else 0.0
+        stats[key] = entry
+    return stats
+
+def build_kol_performance_stats(counts):
+    """
+    Build the get_kol_performance_stats result from per-KOL counts
+    
+    Args:
+        counts: Iterable of (kol_name, total, correct_1d, correct_3d, correct_10d),
+                e.g. the rows of a grouped SQL query
+    
+    Returns:
+        dict: Performance statistics for each KOL
+    """
+    return _stats_from_counts(counts, 'total_predictions')
+
+def build_sentiment_accuracy_stats(counts):
+    """
+    Build the analyze_sentiment_accuracy result from per-sentiment counts
+    
+    Args:
+        counts: Iterable of (lowercase sentiment, total, correct_1d, correct_3d, correct_10d)
+    
+    Returns:
+        dict: Accuracy statistics by sentiment type
+    """
+    sentiment_stats = _stats_from_counts(((s, 0, 0, 0, 0) for s in SENTIMENTS), 'total')
+    for sentiment, stats in _stats_from_counts(counts, 'total').items():
+        if sentiment in sentiment_stats:
+            sentiment_stats[sentiment] = stats
+    return sentiment_stats
+
 def get_kol_performance_stats(records):
     """
     Calculate performance statistics for KOL predictions
@@ -49,46 +175,10 @@ def get_kol_performance_stats(records):
     Returns:
         dict: Performance statistics for each KOL
     """
-    kol_stats = {}
-    
-    for record in records:
-        if record.return_1d is None:
-            continue
-            
-        if record.kol_name not in kol_stats:
-            kol_stats[record.kol_name] = {
-                'total_predictions': 0,
-                'correct_1d': 0,
-                'correct_3d': 0,
-                'correct_10d': 0,
-                'accuracy_1d': 0.0,
-                'accuracy_3d': 0.0,
-                'accuracy_10d': 0.0
-            }
-        
-        kol_stats[record.kol_name]['total_predictions'] += 1
-        
-        # Calculate accuracy for each time period
-        if record.return_1d is not None:
-            if is_direction_correct(record.sentiment, record.return_1d):
-                kol_stats[record.kol_name]['correct_1d'] += 1
-        
-        if record.return_3d is not None:
-            if is_direction_correct(record.sentiment, record.return_3d):
-                kol_stats[record.kol_name]['correct_3d'] += 1
-        
-        if record.return_10d is not None:
-            if is_direction_correct(record.sentiment, record.return_10d):
-                kol_stats[record.kol_name]['correct_10d'] += 1
-    
-    # Calculate accuracy percentages
-    for kol_name, stats in kol_stats.items():
-        if stats['total_predictions'] > 0:
-            stats['accuracy_1d'] = stats['correct_1d'] / stats['total_predictions']
-            stats['accuracy_3d'] = stats['correct_3d'] / stats['total_predictions']
-            stats['accuracy_10d'] = stats['correct_10d'] / stats['total_predictions']
-    
-    return kol_stats
+    df = _correctness_frame(records)
+    if df.empty:
+        return {}
+    return build_kol_performance_stats(_group_correct_counts(df, 'kol_name'))
 
 def analyze_sentiment_accuracy(records):
     """
@@ -100,40 +190,10 @@ def analyze_sentiment_accuracy(records):
     Returns:
         dict: Accuracy statistics by sentiment type
     """
-    sentiment_stats = {
-        'positive': {'total': 0, 'correct_1d': 0, 'correct_3d': 0, 'correct_10d': 0, 'accuracy_1d': 0.0, 'accuracy_3d': 0.0, 'accuracy_10d': 0.0},
-        'negative': {'total': 0, 'correct_1d': 0, 'correct_3d': 0, 'correct_10d': 0, 'accuracy_1d': 0.0, 'accuracy_3d': 0.0, 'accuracy_10d': 0.0},
-        'neutral': {'total': 0, 'correct_1d': 0, 'correct_3d': 0, 'correct_10d': 0, 'accuracy_1d': 0.0, 'accuracy_3d': 0.0, 'accuracy_10d': 0.0}
-    }
-    
-    for record in records:
-        if record.return_1d is None:
-            continue
-            
-        sentiment = record.sentiment.lower()
-        if sentiment in sentiment_stats:
-            sentiment_stats[sentiment]['total'] += 1
-            
-            if record.return_1d is not None:
-                if is_direction_correct(record.sentiment, record.return_1d):
-                    sentiment_stats[sentiment]['correct_1d'] += 1
-            
-            if record.return_3d is not None:
-                if is_direction_correct(record.sentiment, record.return_3d):
-                    sentiment_stats[sentiment]['correct_3d'] += 1
-            
-            if record.return_10d is not None:
-                if is_direction_correct(record.sentiment, record.return_10d):
-                    sentiment_stats[sentiment]['correct_10d'] += 1
-    
-    # Calculate accuracy percentages
-    for sentiment, stats in sentiment_stats.items():
-        if stats['total'] > 0:
-            stats['accuracy_1d'] = stats['correct_1d'] / stats['total']
-            stats['accuracy_3d'] = stats['correct_3d'] / stats['total']
-            stats['accuracy_10d'] = stats['correct_10d'] / stats['total']
-    
-    return sentiment_stats
+    df = _correctness_frame(records)
+    if df.empty:
+        return build_sentiment_accuracy_stats([])
+    return build_sentiment_accuracy_stats(_group_correct_counts(df, df['sentiment'].str.lower()))
 
 # Example usage
 if __name__ == "__main__":
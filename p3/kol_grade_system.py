@@ -1,3 +1,5 @@
+import numpy as np
+
 def calculate_kol_grade(
     accuracy: float,
     sharpe: float,
@@ -28,17 +30,45 @@ def calculate_kol_grade(
     grade = 100 * (w_acc * accuracy + w_sharpe * sharpe_score + w_sample * sample_score)
     return round(grade, 2)
 
+def calculate_kol_grade_vec(
+    accuracy: np.ndarray,
+    sharpe: np.ndarray,
+    sample_num: np.ndarray,
+    w_acc: float = 0.5,
+    w_sharpe: float = 0.3,
+    w_sample: float = 0.2,
+    sample_norm: int = 50
+) -> np.ndarray:
+    """
+    Vectorized calculate_kol_grade over arrays of KOLs.
+    
+    Args:
+        accuracy (np.ndarray): Direction correctness rates (0~1)
+        sharpe (np.ndarray): Sharpe ratios
+        sample_num (np.ndarray): Numbers of samples/messages
+        w_acc, w_sharpe, w_sample (float): Weights for each factor
+        sample_norm (int): Normalization base for sample number
+    
+    Returns:
+        np.ndarray: Grades (0~100)
+    """
+    sample_score = np.minimum(np.asarray(sample_num, dtype=np.float64) / sample_norm, 1.0)
+    sharpe_score = np.clip(np.asarray(sharpe, dtype=np.float64) / 2, 0, 1.0)
+    grade = 100 * (w_acc * np.asarray(accuracy, dtype=np.float64) + w_sharpe * sharpe_score + w_sample * sample_score)
+    return np.round(grade, 2)
+
 def add_grade_to_performance(performance_metrics: dict) -> dict:
     """
     Add grade to each KOL's performance metrics dict.
     """
-    for kol_name, metrics in performance_metrics.items():
-        # Here we use 1d Sharpe as an example, you can change it to average or maximum Sharpe
-        grade = calculate_kol_grade(
-            accuracy=metrics.direction_correctness_rate,
-            sharpe=metrics.sharpe_ratio_1d,
-            sample_num=metrics.total_predictions
-        )
+    metrics_list = list(performance_metrics.values())
+    # Here we use 1d Sharpe as an example, you can change it to average or maximum Sharpe
+    grades = calculate_kol_grade_vec(
+        accuracy=[m.direction_correctness_rate for m in metrics_list],
+        sharpe=[m.sharpe_ratio_1d for m in metrics_list],
+        sample_num=[m.total_predictions for m in metrics_list]
+    )
+    for metrics, grade in zip(metrics_list, grades.tolist()):
         setattr(metrics, 'grade', grade)
     return performance_metrics
 
@@ -1,13 +1,27 @@
+import heapq
+import math
 import numpy as np
-from typing import List, Dict, Any
-from dataclasses import dataclass
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Index
+import pandas as pd
+from typing import List, Dict, Any, Tuple
+from dataclasses import asdict, dataclass
+from sqlalchemy import Column, Integer, String, Float, DateTime, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional; the numpy bincount path is used instead
+    njit = None
+    prange = range
+from kol_grade_system import calculate_kol_grade_vec
+from kol_accuracy import RETURN_COLUMNS, direction_correct_vec, records_to_frame
+from sqlite_config import create_sqlite_engine
 
 Base = declarative_base()
 
+RISK_FREE_RATE = 0.001
+BENCHMARK_RETURN = 0.01
+
 class KOLPerformanceMetricsTable(Base):
     __tablename__ = 'kol_performance_metrics'
     id = Column(Integer, primary_key=True)
@@ -51,79 +65,180 @@ class KOLPerformanceMetrics:
     information_ratio_10d: float
     total_predictions: int
 
-def calculate_kol_performance_metrics(records) -> Dict[str, KOLPerformanceMetrics]:
+def calculate_kol_performance_metrics(records, attach_grade: bool = False) -> Dict[str, KOLPerformanceMetrics]:
     """
     Calculate comprehensive performance metrics for each KOL
     
     Args:
-        records: List of KOLSentiment records with return data
+        records: List of KOLSentiment records with return data, or a DataFrame
+                 with kol_name, sentiment and return_1d/3d/10d columns
+        attach_grade: Also set .grade on each result, graded from the arrays
+                      computed here (same as add_grade_to_performance)
     
     Returns:
         Dict mapping KOL names to their performance metrics
     """
-    kol_metrics = {}
+    df = records_to_frame(records)
+    df = df[df['return_1d'].notna()]
+    if df.empty:
+        return {}
     
-    for record in records:
-        if record.return_1d is None:
-            continue
-            
-        if record.kol_name not in kol_metrics:
-            kol_metrics[record.kol_name] = {
-                'returns_1d': [],
-                'returns_3d': [],
-                'returns_10d': [],
-                'correct_predictions': 0,
-                'total_predictions': 0
-            }
-        
-        kol_metrics[record.kol_name]['total_predictions'] += 1
-        
-        # Store returns for each time period
-        if record.return_1d is not None:
-            kol_metrics[record.kol_name]['returns_1d'].append(record.return_1d)
-        if record.return_3d is not None:
-            kol_metrics[record.kol_name]['returns_3d'].append(record.return_3d)
-        if record.return_10d is not None:
-            kol_metrics[record.kol_name]['returns_10d'].append(record.return_10d)
-        
-        # Count correct predictions
-        if record.return_1d is not None and is_direction_correct(record.sentiment, record.return_1d):
-            kol_metrics[record.kol_name]['correct_predictions'] += 1
+    # Columnar layout: one integer group id per record plus one array per horizon
+    kol_ids, kol_names = pd.factorize(df['kol_name'], sort=False)
+    n_kols = len(kol_names)
+    total_predictions = np.bincount(kol_ids, minlength=n_kols)
     
-    # Calculate metrics for each KOL
-    performance_results = {}
+    # Direction correctness is judged on the 1-day return
+    correct = direction_correct_vec(df['sentiment'].to_numpy(), df['return_1d'].to_numpy())
+    direction_correctness_rate = np.bincount(kol_ids, weights=correct, minlength=n_kols) / total_predictions
     
-    for kol_name, data in kol_metrics.items():
-        if data['total_predictions'] == 0:
-            continue
-            
-        # Direction correctness rate
-        direction_correctness_rate = data['correct_predictions'] / data['total_predictions']
-        
-        # Calculate metrics for each time period
-        metrics_1d = calculate_period_metrics(data['returns_1d'])
-        metrics_3d = calculate_period_metrics(data['returns_3d'])
-        metrics_10d = calculate_period_metrics(data['returns_10d'])
-        
-        performance_results[kol_name] = KOLPerformanceMetrics(
+    returns = np.column_stack([df[column].to_numpy() for column in RETURN_COLUMNS])
+    counts, sums, sums_sq = _group_moments(kol_ids, returns, n_kols)
+    period = {}
+    for j, column in enumerate(RETURN_COLUMNS):
+        period[column] = {
+            name: values.tolist()
+            for name, values in calculate_period_metrics_arrays(counts[:, j], sums[:, j], sums_sq[:, j]).items()
+        }
+    m1, m3, m10 = period['return_1d'], period['return_3d'], period['return_10d']
+    rates = direction_correctness_rate.tolist()
+    totals = total_predictions.tolist()
+    
+    performance_metrics = {
+        kol_name: KOLPerformanceMetrics(
             kol_name=kol_name,
-            direction_correctness_rate=direction_correctness_rate,
-            mean_return_1d=metrics_1d['mean_return'],
-            mean_return_3d=metrics_3d['mean_return'],
-            mean_return_10d=metrics_10d['mean_return'],
-            volatility_1d=metrics_1d['volatility'],
-            volatility_3d=metrics_3d['volatility'],
-            volatility_10d=metrics_10d['volatility'],
-            sharpe_ratio_1d=metrics_1d['sharpe_ratio'],
-            sharpe_ratio_3d=metrics_3d['sharpe_ratio'],
-            sharpe_ratio_10d=metrics_10d['sharpe_ratio'],
-            information_ratio_1d=metrics_1d['information_ratio'],
-            information_ratio_3d=metrics_3d['information_ratio'],
-            information_ratio_10d=metrics_10d['information_ratio'],
-            total_predictions=data['total_predictions']
+            direction_correctness_rate=rates[i],
+            mean_return_1d=m1['mean_return'][i],
+            mean_return_3d=m3['mean_return'][i],
+            mean_return_10d=m10['mean_return'][i],
+            volatility_1d=m1['volatility'][i],
+            volatility_3d=m3['volatility'][i],
+            volatility_10d=m10['volatility'][i],
+            sharpe_ratio_1d=m1['sharpe_ratio'][i],
+            sharpe_ratio_3d=m3['sharpe_ratio'][i],
+            sharpe_ratio_10d=m10['sharpe_ratio'][i],
+            information_ratio_1d=m1['information_ratio'][i],
+            information_ratio_3d=m3['information_ratio'][i],
+            information_ratio_10d=m10['information_ratio'][i],
+            total_predictions=totals[i]
+        )
+        for i, kol_name in enumerate(kol_names)
+    }
+    
+    if attach_grade:
+        grades = calculate_kol_grade_vec(
+            accuracy=direction_correctness_rate,
+            sharpe=m1['sharpe_ratio'],
+            sample_num=total_predictions
         )
+        for metrics, grade in zip(performance_metrics.values(), grades.tolist()):
+            metrics.grade = grade
+    return performance_metrics
+
+def _group_moments(group_ids: np.ndarray, values: np.ndarray, n_groups: int):
+    """
+    Per-group count, sum and sum of squares of each column of values, skipping NaN
+    
+    Uses the parallel numba kernel when numba is installed, np.bincount otherwise.
+    
+    Args:
+        group_ids: Integer group id for each row (0 <= id < n_groups)
+        values: 2-D array (rows x columns, float32 or float64), NaN for missing
+        n_groups: Number of groups
+    
+    Returns:
+        Tuple of (counts, sums, sums_sq) arrays of shape (n_groups, columns)
+    """
+    if njit is not None:
+        # Group rows contiguously so each parallel task scans one slice
+        order = np.argsort(group_ids, kind='stable')
+        offsets = np.zeros(n_groups + 1, dtype=np.int64)
+        np.cumsum(np.bincount(group_ids, minlength=n_groups), out=offsets[1:])
+        return _group_moments_kernel(order, offsets, values)
+    
+    n_cols = values.shape[1]
+    counts = np.zeros((n_groups, n_cols), dtype=np.int64)
+    sums = np.zeros((n_groups, n_cols))
+    sums_sq = np.zeros((n_groups, n_cols))
+    for j in range(n_cols):
+        valid = ~np.isnan(values[:, j])
+        ids = group_ids[valid]
+        # Accumulate in float64 even when the stored returns are float32
+        column = values[valid, j].astype(np.float64)
+        counts[:, j] = np.bincount(ids, minlength=n_groups)
+        sums[:, j] = np.bincount(ids, weights=column, minlength=n_groups)
+        sums_sq[:, j] = np.bincount(ids, weights=column * column, minlength=n_groups)
+    return counts, sums, sums_sq
+
+def _group_moments_kernel(order, offsets, values):
+    """Single pass over each group's rows; groups are processed in parallel under numba"""
+    n_groups = len(offsets) - 1
+    n_cols = values.shape[1]
+    counts = np.zeros((n_groups, n_cols), dtype=np.int64)
+    sums = np.zeros((n_groups, n_cols))
+    sums_sq = np.zeros((n_groups, n_cols))
+    for g in prange(n_groups):
+        for k in range(offsets[g], offsets[g + 1]):
+            row = order[k]
+            for j in range(n_cols):
+                x = np.float64(values[row, j])
+                if not np.isnan(x):
+                    counts[g, j] += 1
+                    sums[g, j] += x
+                    sums_sq[g, j] += x * x
+    return counts, sums, sums_sq
+
+if njit is not None:
+    _group_moments_kernel = njit(parallel=True, cache=True)(_group_moments_kernel)
+
+def calculate_period_metrics_arrays(counts: np.ndarray, sums: np.ndarray, sums_sq: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Vectorized counterpart of calculate_period_metrics from per-KOL moments
+    
+    Args:
+        counts: Number of returns per KOL
+        sums: Sum of returns per KOL
+        sums_sq: Sum of squared returns per KOL
     
-    return performance_results
+    Returns:
+        Dictionary of mean_return, volatility, sharpe_ratio and information_ratio arrays
+    """
+    counts = counts.astype(np.float64)
+    has_returns = counts > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_return = np.where(has_returns, sums / counts, 0.0)
+        # Sample variance; NaN for a single return, as with np.std(ddof=1)
+        variance = np.maximum(sums_sq - sums * mean_return, 0.0) / (counts - 1)
+        volatility = np.where(has_returns, np.sqrt(variance), 0.0)
+        positive_vol = volatility > 0
+        sharpe_ratio = np.where(positive_vol, (mean_return - RISK_FREE_RATE) / volatility, 0.0)
+        information_ratio = np.where(positive_vol, (mean_return - BENCHMARK_RETURN) / volatility, 0.0)
+    return {
+        'mean_return': mean_return,
+        'volatility': volatility,
+        'sharpe_ratio': sharpe_ratio,
+        'information_ratio': information_ratio
+    }
+
+def _mean_std_welford(arr: np.ndarray) -> Tuple[float, float]:
+    """
+    Mean and sample standard deviation from one pass of sums over arr
+    
+    Args:
+        arr: 1-D array of returns (non-empty)
+    
+    Returns:
+        Tuple of (mean, sample std); std is NaN for a single value, as np.std(ddof=1)
+    """
+    n = arr.size
+    # float64 accumulators keep float32 inputs from losing precision
+    sum_x = float(arr.sum(dtype=np.float64))
+    sum_x2 = float(np.dot(arr, arr.astype(np.float64)))
+    mean = sum_x / n
+    if n < 2:
+        return mean, float('nan')
+    var = max(sum_x2 - sum_x * mean, 0.0) / (n - 1)
+    return mean, math.sqrt(var)
 
 def calculate_period_metrics(returns: List[float]) -> Dict[str, float]:
     """
@@ -143,16 +258,15 @@ def calculate_period_metrics(returns: List[float]) -> Dict[str, float]:
             'information_ratio': 0.0
         }
     
-    returns_array = np.array(returns)
-    mean_return = float(np.mean(returns_array))
-    risk_free_rate = 0.001
-    volatility = float(np.std(returns_array, ddof=1))  # Sample standard deviation
+    returns_array = np.asarray(returns, dtype=np.float32)
+    mean_return, volatility = _mean_std_welford(returns_array)
+    risk_free_rate = RISK_FREE_RATE
     
     # Sharpe ratio (assuming risk-free rate of 0 for simplicity)
     sharpe_ratio = float((mean_return - risk_free_rate) / volatility if volatility > 0 else 0.0)
     
     # Information ratio (excess return relative to benchmark)
-    benchmark_return = 0.01
+    benchmark_return = BENCHMARK_RETURN
     tracking_error = volatility
     information_ratio = float((mean_return - benchmark_return) / tracking_error if tracking_error > 0 else 0.0)
     
@@ -163,26 +277,6 @@ def calculate_period_metrics(returns: List[float]) -> Dict[str, float]:
         'information_ratio': information_ratio
     }
 
-def is_direction_correct(sentiment: str, ret: float) -> int:
-    """
-    Check if the KOL sentiment prediction direction is correct
-    
-    Args:
-        sentiment: KOL sentiment prediction
-        ret: Actual return value
-    
-    Returns:
-        1 if prediction is correct, 0 if incorrect
-    """
-    if sentiment.lower() == "positive" and ret > 0:
-        return 1
-    elif sentiment.lower() == "negative" and ret < 0:
-        return 1
-    elif sentiment.lower() == "neutral" and abs(ret) < 0.01:
-        return 1
-    else:
-        return 0
-
 def print_performance_summary(performance_metrics: Dict[str, KOLPerformanceMetrics]):
     """
     Print a formatted summary of KOL performance metrics
@@ -240,45 +334,33 @@ def get_top_performers(performance_metrics: Dict[str, KOLPerformanceMetrics],
     if metric not in valid_metrics:
         raise ValueError(f"Invalid metric. Must be one of: {valid_metrics}")
     
-    performers = []
-    for kol_name, metrics in performance_metrics.items():
-        metric_value = getattr(metrics, metric)
-        performers.append((kol_name, metric_value))
-    
-    # Sort by metric value (descending)
-    performers.sort(key=lambda x: x[1], reverse=True)
+    performers = ((kol_name, getattr(metrics, metric)) for kol_name, metrics in performance_metrics.items())
     
-    return performers[:top_n]
+    # Partial selection of the top_n (descending), same order as a full sort
+    return heapq.nlargest(top_n, performers, key=lambda x: x[1])
 
-def save_performance_metrics_to_db(performance_metrics: dict, db_path: str = "kol_performance_metrics.db"):
+def save_performance_metrics_to_db(performance_metrics: dict, db_path: str = "kol_performance_metrics.db",
+                                   batch_size: int = 100):
     """
     Save calculated KOL performance metrics to the database table.
+    
+    Rows are written with executemany-style Core inserts of batch_size rows
+    each, inside a single transaction.
     """
-    engine = create_engine(f'sqlite:///{db_path}')
+    engine = create_sqlite_engine(db_path)
     Base.metadata.create_all(engine)
+    rows = [
+        dict(asdict(metrics), kol_name=kol_name, grade=getattr(metrics, 'grade', None))
+        for kol_name, metrics in performance_metrics.items()
+    ]
+    if not rows:
+        return
     Session = sessionmaker(bind=engine)
     session = Session()
     try:
-        for kol_name, metrics in performance_metrics.items():
-            record = KOLPerformanceMetricsTable(
-                kol_name=kol_name,
-                direction_correctness_rate=metrics.direction_correctness_rate,
-                mean_return_1d=metrics.mean_return_1d,
-                mean_return_3d=metrics.mean_return_3d,
-                mean_return_10d=metrics.mean_return_10d,
-                volatility_1d=metrics.volatility_1d,
-                volatility_3d=metrics.volatility_3d,
-                volatility_10d=metrics.volatility_10d,
-                sharpe_ratio_1d=metrics.sharpe_ratio_1d,
-                sharpe_ratio_3d=metrics.sharpe_ratio_3d,
-                sharpe_ratio_10d=metrics.sharpe_ratio_10d,
-                information_ratio_1d=metrics.information_ratio_1d,
-                information_ratio_3d=metrics.information_ratio_3d,
-                information_ratio_10d=metrics.information_ratio_10d,
-                total_predictions=metrics.total_predictions,
-                grade=getattr(metrics, 'grade', None)
-            )
-            session.add(record)
+        insert_stmt = KOLPerformanceMetricsTable.__table__.insert()
+        for i in range(0, len(rows), batch_size):
+            session.execute(insert_stmt, rows[i:i + batch_size])
         session.commit()
     finally:
         session.close()
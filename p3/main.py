@@ -1,9 +1,18 @@
 from KOLSentiment import KOLSentimentDB
 from kol_performance_metrics import calculate_kol_performance_metrics, print_performance_summary, save_performance_metrics_to_db
-from kol_grade_system import add_grade_to_performance
 import datetime
+import sys
 import pandas as pd
-from datetime import datetime as dt
+
+# kol_sample_data.csv 中用到的列及其类型
+# confidence 保持 float64，float32 会把 0.85 之类的值变成 0.8500000238
+CSV_DTYPES = {
+    'kol_name': 'string',
+    'ticker': 'string',
+    'sector': 'string',
+    'sentiment': 'string',
+    'confidence': 'float64',
+}
 
 def load_kol_data_from_csv(csv_file="kol_sample_data.csv"):
     """
@@ -12,34 +21,27 @@ def load_kol_data_from_csv(csv_file="kol_sample_data.csv"):
     print(f"Loading KOL data from {csv_file}...")
     
     try:
-        # 读取CSV文件
-        df = pd.read_csv(csv_file)
+        # 读取CSV文件（显式指定列和类型，跳过类型推断；prediction_time 在下面统一解析）
+        df = pd.read_csv(csv_file, dtype=CSV_DTYPES, usecols=list(CSV_DTYPES) + ['prediction_time'], engine='c')
         print(f"Loaded {len(df)} records from CSV")
         
-        # 转换数据格式
-        sample_data = []
-        for index, row in df.iterrows():
-            try:
-                # 解析时间字符串
-                if isinstance(row['prediction_time'], str):
-                    # 处理带时区的时间格式
-                    time_str = row['prediction_time'].replace('+00:00', '')
-                    prediction_time = dt.fromisoformat(time_str)
-                else:
-                    prediction_time = row['prediction_time']
-                
-                # 构建tuple格式的数据
-                sample_data.append((
-                    row['kol_name'],      # kol_name
-                    row['ticker'],        # ticker
-                    row['sector'],        # sector
-                    row['sentiment'],     # sentiment
-                    float(row['confidence']),  # confidence
-                    prediction_time       # prediction_time
-                ))
-            except Exception as e:
-                print(f"Error processing row {index}: {e}")
-                continue
+        # 整列一次性解析 ISO-8601 时间，统一转为 UTC 后去掉时区（与数据库中的 naive 时间一致）
+        prediction_times = pd.to_datetime(df['prediction_time'], format='ISO8601', utc=True,
+                                          errors='coerce', cache=True).dt.tz_localize(None)
+        invalid = prediction_times.isna()
+        if invalid.any():
+            print(f"Skipping {int(invalid.sum())} rows with invalid prediction_time")
+        df = df.assign(prediction_time=prediction_times)[~invalid]
+        
+        # 按列整体转换后一次性 zip 成 tuple，不逐行构造 Series
+        sample_data = list(zip(
+            df['kol_name'].tolist(),
+            df['ticker'].tolist(),
+            df['sector'].tolist(),
+            df['sentiment'].tolist(),
+            df['confidence'].astype('float64').tolist(),
+            df['prediction_time'].dt.to_pydatetime()
+        ))
         
         print(f"Successfully converted {len(sample_data)} records")
         return sample_data
@@ -51,27 +53,30 @@ def load_kol_data_from_csv(csv_file="kol_sample_data.csv"):
         print(f"Error loading CSV: {e}, using default sample data")
         return get_default_sample_data()
 
+# 默认示例数据，模块加载时构建一次
+_DEFAULT_SAMPLE_DATA = (
+    ("elonmusk", "TSLA", "Tech", "positive", 0.85, datetime.datetime(2025, 6, 2, 0, 0, 0)),
+    ("elonmusk", "TSLA", "Tech", "negative", 0.80, datetime.datetime(2025, 6, 9, 0, 0, 0)),
+    ("warrenbuffett", "AAPL", "Tech", "positive", 0.90, datetime.datetime(2025, 6, 2, 0, 0, 0)),
+    ("warrenbuffett", "AAPL", "Tech", "negative", 0.70, datetime.datetime(2025, 6, 9, 0, 0, 0)),
+    ("cathiewood", "ARKK", "Tech", "positive", 0.75, datetime.datetime(2025, 6, 2, 0, 0, 0)),
+    ("cathiewood", "ARKK", "Tech", "negative", 0.60, datetime.datetime(2025, 6, 9, 0, 0, 0)),
+    ("elonmusk", "TSLA", "Tech", "positive", 0.85, datetime.datetime(2025, 6, 16, 0, 0, 0)),
+    ("elonmusk", "TSLA", "Tech", "negative", 0.80, datetime.datetime(2025, 6, 23, 0, 0, 0)),
+    ("warrenbuffett", "AAPL", "Tech", "positive", 0.90, datetime.datetime(2025, 6, 16, 0, 0, 0)),
+    ("warrenbuffett", "AAPL", "Tech", "negative", 0.70, datetime.datetime(2025, 6, 23, 0, 0, 0)),
+    ("cathiewood", "ARKK", "Tech", "positive", 0.75, datetime.datetime(2025, 6, 16, 0, 0, 0)),
+    ("cathiewood", "ARKK", "Tech", "negative", 0.60, datetime.datetime(2025, 6, 23, 0, 0, 0)),
+    ("elonmusk", "TSLA", "Tech", "positive", 0.85, datetime.datetime(2025, 6, 30, 0, 0, 0)),
+    ("warrenbuffett", "AAPL", "Tech", "positive", 0.90, datetime.datetime(2025, 6, 30, 0, 0, 0)),
+    ("cathiewood", "ARKK", "Tech", "positive", 0.75, datetime.datetime(2025, 6, 30, 0, 0, 0)),
+)
+
 def get_default_sample_data():
     """
     返回默认的示例数据
     """
-    return [
-        ("elonmusk", "TSLA", "Tech", "positive", 0.85, datetime.datetime(2025, 6, 2, 0, 0, 0)),
-        ("elonmusk", "TSLA", "Tech", "negative", 0.80, datetime.datetime(2025, 6, 9, 0, 0, 0)),
-        ("warrenbuffett", "AAPL", "Tech", "positive", 0.90, datetime.datetime(2025, 6, 2, 0, 0, 0)),
-        ("warrenbuffett", "AAPL", "Tech", "negative", 0.70, datetime.datetime(2025, 6, 9, 0, 0, 0)),
-        ("cathiewood", "ARKK", "Tech", "positive", 0.75, datetime.datetime(2025, 6, 2, 0, 0, 0)),
-        ("cathiewood", "ARKK", "Tech", "negative", 0.60, datetime.datetime(2025, 6, 9, 0, 0, 0)),
-        ("elonmusk", "TSLA", "Tech", "positive", 0.85, datetime.datetime(2025, 6, 16, 0, 0, 0)),
-        ("elonmusk", "TSLA", "Tech", "negative", 0.80, datetime.datetime(2025, 6, 23, 0, 0, 0)),
-        ("warrenbuffett", "AAPL", "Tech", "positive", 0.90, datetime.datetime(2025, 6, 16, 0, 0, 0)),
-        ("warrenbuffett", "AAPL", "Tech", "negative", 0.70, datetime.datetime(2025, 6, 23, 0, 0, 0)),
-        ("cathiewood", "ARKK", "Tech", "positive", 0.75, datetime.datetime(2025, 6, 16, 0, 0, 0)),
-        ("cathiewood", "ARKK", "Tech", "negative", 0.60, datetime.datetime(2025, 6, 23, 0, 0, 0)),
-        ("elonmusk", "TSLA", "Tech", "positive", 0.85, datetime.datetime(2025, 6, 30, 0, 0, 0)),
-        ("warrenbuffett", "AAPL", "Tech", "positive", 0.90, datetime.datetime(2025, 6, 30, 0, 0, 0)),
-        ("cathiewood", "ARKK", "Tech", "positive", 0.75, datetime.datetime(2025, 6, 30, 0, 0, 0)),
-    ]
+    return list(_DEFAULT_SAMPLE_DATA)
 
 def run_integration_test():
     # 1. Initialize database
@@ -79,34 +84,34 @@ def run_integration_test():
     
     # 2. Load data from CSV file (or use default sample data if CSV not found)
     sample_data = load_kol_data_from_csv("kol_sample_data.csv")
-    for kol_name, ticker, sector, sentiment, confidence, prediction_time in sample_data:
-        db.insert_record_with_returns(kol_name, ticker, sector, sentiment, confidence, prediction_time)
+    db.insert_many(sample_data)  # one transaction for the whole batch
     
     # 3. Query all records with returns
-    records = db.get_records_with_returns()
+    records = db.get_returns_frame()
     print(f"Total records with returns: {len(records)}")
     
-    # 4. Calculate KOL performance metrics
-    performance_metrics = calculate_kol_performance_metrics(records)
+    # 4. Calculate KOL performance metrics and grades
+    performance_metrics = calculate_kol_performance_metrics(records, attach_grade=True)
     print_performance_summary(performance_metrics)
     
-    # 5. Calculate grades
-    performance_metrics = add_grade_to_performance(performance_metrics)
-    
-    # 6. Print final table
+    # 5. Print final table
     print("\nFinal KOL Table:")
     print("{:<15} {:<8} {:<8} {:<8} {:<12} {:<8}".format(
         "KOL", "Grade", "Accuracy", "Sharpe", "MeanRet", "Samples"
     ))
-    for kol, metrics in performance_metrics.items():
-        print("{:<15} {:<8} {:<8.2f} {:<8.2f} {:<12.2%} {:<8}".format(
+    # 格式串只解析一次，整表一次写出
+    row_format = "{:<15} {:<8} {:<8.2f} {:<8.2f} {:<12.2%} {:<8}\n".format
+    sys.stdout.writelines(
+        row_format(
             kol,
             getattr(metrics, "grade", 0),
             metrics.direction_correctness_rate,
             metrics.sharpe_ratio_1d,
             metrics.mean_return_1d,
             metrics.total_predictions
-        ))
+        )
+        for kol, metrics in performance_metrics.items()
+    )
     save_performance_metrics_to_db(performance_metrics)
 
 def run_csv_analysis():
@@ -129,37 +134,38 @@ def run_csv_analysis():
     
     # 3. Insert data into database
     print(f"\nInserting {len(sample_data)} records into database...")
-    for kol_name, ticker, sector, sentiment, confidence, prediction_time in sample_data:
-        db.insert_record_with_returns(kol_name, ticker, sector, sentiment, confidence, prediction_time)
+    inserted = db.insert_many(sample_data)  # one transaction for the whole batch
+    print(f"Inserted {inserted} records")
     
     # 4. Query all records with returns
-    records = db.get_records_with_returns()
+    records = db.get_returns_frame()
     print(f"Total records with returns: {len(records)}")
     
-    # 5. Calculate KOL performance metrics
-    performance_metrics = calculate_kol_performance_metrics(records)
+    # 5. Calculate KOL performance metrics and grades
+    performance_metrics = calculate_kol_performance_metrics(records, attach_grade=True)
     print_performance_summary(performance_metrics)
     
-    # 6. Calculate grades
-    performance_metrics = add_grade_to_performance(performance_metrics)
-    
-    # 7. Print final table
+    # 6. Print final table
     print("\nFinal KOL Performance Table:")
     print("{:<20} {:<8} {:<8} {:<8} {:<12} {:<8}".format(
         "KOL", "Grade", "Accuracy", "Sharpe", "MeanRet", "Samples"
     ))
     print("-" * 70)
-    for kol, metrics in performance_metrics.items():
-        print("{:<20} {:<8} {:<8.2f} {:<8.2f} {:<12.2%} {:<8}".format(
+    # 格式串只解析一次，整表一次写出
+    row_format = "{:<20} {:<8} {:<8.2f} {:<8.2f} {:<12.2%} {:<8}\n".format
+    sys.stdout.writelines(
+        row_format(
             kol,
             getattr(metrics, "grade", 0),
             metrics.direction_correctness_rate,
             metrics.sharpe_ratio_1d,
             metrics.mean_return_1d,
             metrics.total_predictions
-        ))
+        )
+        for kol, metrics in performance_metrics.items()
+    )
     
-    # 8. Save performance metrics to database
+    # 7. Save performance metrics to database
     save_performance_metrics_to_db(performance_metrics)
     
     print(f"\nAnalysis complete! Results saved to kol_sentiment_csv.db")
@@ -177,32 +183,23 @@ def test_csv_loading():
         for i, record in enumerate(sample_data[:5]):
             print(f"  {i+1}. {record}")
         
-        # 统计数据
-        kol_names = set()
-        tickers = set()
-        sectors = set()
-        sentiments = {"positive": 0, "negative": 0, "neutral": 0}
-        
-        for kol_name, ticker, sector, sentiment, confidence, prediction_time in sample_data:
-            kol_names.add(kol_name)
-            tickers.add(ticker)
-            sectors.add(sector)
-            if sentiment in sentiments:
-                sentiments[sentiment] += 1
+        # 统计数据（按列一次性计算）
+        df = pd.DataFrame(sample_data, columns=['kol_name', 'ticker', 'sector', 'sentiment', 'confidence', 'prediction_time'])
+        tickers = df['ticker'].unique()
+        sentiment_counts = df['sentiment'].value_counts()
+        sentiments = {s: int(sentiment_counts.get(s, 0)) for s in ("positive", "negative", "neutral")}
         
         print(f"\nData Statistics:")
-        print(f"  KOL Names: {list(kol_names)}")
+        print(f"  KOL Names: {df['kol_name'].unique().tolist()}")
         print(f"  Number of unique tickers: {len(tickers)}")
-        print(f"  Tickers: {sorted(list(tickers))}")
-        print(f"  Sectors: {sorted(list(sectors))}")
+        print(f"  Tickers: {sorted(tickers)}")
+        print(f"  Sectors: {sorted(df['sector'].unique())}")
         print(f"  Sentiment distribution: {sentiments}")
     else:
         print("Failed to load data from CSV")
 
 if __name__ == "__main__":
     # 可以选择运行哪个测试
-    import sys
-    
     if len(sys.argv) > 1 and sys.argv[1] == "csv":
         run_csv_analysis()
     elif len(sys.argv) > 1 and sys.argv[1] == "test":
@@ -0,0 +1,46 @@
+"""
+SQLite 引擎配置
+"""
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import StaticPool
+
+# 每个新连接上执行的 PRAGMA
+# WAL 模式下提交只追加写入 -wal 文件，synchronous=NORMAL 时只在 checkpoint 时 fsync
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64000,       # 约 64MB 页缓存（负数单位为 KiB）
+    "temp_store": "MEMORY",
+    "mmap_size": 268435456,     # 256MB 内存映射读取
+}
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """连接建立时设置 PRAGMA"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+def create_sqlite_engine(db_path: str):
+    """
+    创建带 PRAGMA 调优的 SQLite 引擎
+
+    使用 StaticPool 在所有 Session 之间复用同一个连接，避免每次查询都重新打开
+    .db / .db-wal / .db-shm 文件，PRAGMA 也只需在这一个连接上执行一次。
+
+    Args:
+        db_path: 数据库文件路径
+
+    Returns:
+        SQLAlchemy Engine
+    """
+    engine = create_engine(
+        f'sqlite:///{db_path}',
+        poolclass=StaticPool,
+        connect_args={"check_same_thread": False},
+    )
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    return engine
@@ -1,83 +1,123 @@
+import numpy as np
 import pandas as pd
 import json
+import mmap
 import os
-from datetime import datetime
+try:
+    import orjson
+except ImportError:  # orjson is optional; the standard json module is used instead
+    orjson = None
 
 # Read the CSV file
 input_file = '../opinion_mining/output_data/youtube_subtitles_Invest_with_Henry(By Gemini).csv'
 output_file = 'extracted_video_data.csv'
 company_knowledge_file = '../opinion_mining/knowledge_library/company_knowledge.json'
 processed_output_file = 'processed_video_data_with_tickers.csv'
+# Rows per read_csv chunk; caps peak memory on large subtitle files
+CHUNK_SIZE = 200_000
+# At most this many per-row errors are printed
+MAX_LOGGED_ERRORS = 20
+# Only kol_sample_data.csv is consumed by main.py; the intermediate CSVs are written
+# for inspection when DEBUG=1 is set in the environment
+DEBUG = os.environ.get('DEBUG', '').lower() in ('1', 'true', 'yes')
 
 try:
-    # Load the CSV file
-    df = pd.read_csv(input_file)
-    
-    # Check if the required columns exist
+    # Check if the required columns exist (header only)
     required_columns = ['video_id', 'channel_name', 'publishedAt', 'title', 'company', 'confidence', 'sentiment']
-    missing_columns = [col for col in required_columns if col not in df.columns]
+    all_columns = list(pd.read_csv(input_file, nrows=0).columns)
+    missing_columns = [col for col in required_columns if col not in all_columns]
     
     if missing_columns:
         print(f"Warning: The following columns do not exist in the original file: {missing_columns}")
-        print(f"Available columns: {list(df.columns)}")
-    
-    # Extract the existing columns
-    available_columns = [col for col in required_columns if col in df.columns]
-    extracted_df = df[available_columns].copy()
-    
-    # Save to a new CSV file
-    extracted_df.to_csv(output_file, index=False, encoding='utf-8')
-    
-    print(f"Successfully extracted data!")
-    print(f"Original data rows: {len(df)}")
-    print(f"Extracted columns: {available_columns}")
-    print(f"Output file: {output_file}")
-    print(f"Extracted data rows: {len(extracted_df)}")
-    
-    # Display the first few rows of data preview
-    print("\nData preview:")
-    print(extracted_df.head())
+        print(f"Available columns: {all_columns}")
     
     # Load company knowledge base
     print(f"\nLoading company knowledge base from {company_knowledge_file}...")
-    with open(company_knowledge_file, 'r', encoding='utf-8') as f:
-        company_knowledge = json.load(f)
+    with open(company_knowledge_file, 'rb') as f:
+        if orjson is not None:
+            # Parse straight from the memory-mapped UTF-8 bytes, no intermediate str
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+                company_knowledge = orjson.loads(view)
+        else:
+            company_knowledge = json.load(f)
     
     print(f"Loaded {len(company_knowledge)} companies from knowledge base")
+    # Hash the company names once; each chunk then needs a single get_indexer pass
+    # to find both ticker and sector. Position -1 (no match) picks the trailing None.
+    company_index = pd.Index(list(company_knowledge.keys()))
+    company_tickers = np.array([info['ticker'] for info in company_knowledge.values()] + [None], dtype=object)
+    company_sectors = np.array([info['sector'] for info in company_knowledge.values()] + [None], dtype=object)
+    
+    # Stream only the existing required columns, with declared types, so a large
+    # file is never fully materialized (sentiment is left to inference; non-numeric
+    # scores are labelled neutral below)
+    available_columns = [col for col in required_columns if col in all_columns]
+    column_dtypes = {
+        'video_id': 'string',
+        'channel_name': 'string',
+        'publishedAt': 'string',
+        'title': 'string',
+        'company': 'string',
+        'confidence': 'float64',
+    }
+    reader = pd.read_csv(input_file, usecols=available_columns, engine='c', chunksize=CHUNK_SIZE,
+                         dtype={col: t for col, t in column_dtypes.items() if col in available_columns})
     
-    # Process the data to add ticker information
     print("\nProcessing data to match companies with tickers...")
-    
-    # Add ticker column
-    extracted_df['ticker'] = None
-    extracted_df['sector'] = None
-    
+    total_rows = 0
     matched_companies = 0
     unmatched_companies = set()
+    preview_df = None
+    processed_parts = []
+    for chunk_number, chunk in enumerate(reader):
+        chunk = chunk[available_columns]
+        if DEBUG:
+            # Save the extracted columns to a new CSV file, one chunk at a time
+            chunk.to_csv(output_file, mode='w' if chunk_number == 0 else 'a', header=chunk_number == 0,
+                         index=False, encoding='utf-8')
+        if preview_df is None:
+            preview_df = chunk.head()
+        total_rows += len(chunk)
+        
+        # Add ticker and sector columns with a vectorized lookup by company name
+        positions = company_index.get_indexer(chunk['company'])
+        matched = positions >= 0
+        matched_companies += int(matched.sum())
+        unmatched_companies.update(chunk.loc[~matched, 'company'].dropna().unique())
+        
+        chunk = chunk.assign(ticker=company_tickers[positions], sector=company_sectors[positions])
+        # Filter out rows where no ticker was found (跳过找不到的公司)
+        chunk = chunk.dropna(subset=['ticker'])
+        processed_parts.append(chunk)
+    
+    # Chunk indexes continue across the file, so row numbers are kept
+    if processed_parts:
+        processed_df = pd.concat(processed_parts)
+    else:
+        processed_df = pd.DataFrame(columns=available_columns + ['ticker', 'sector'])
     
-    for index, row in extracted_df.iterrows():
-        company_name = row['company']
-        if company_name in company_knowledge:
-            ticker = company_knowledge[company_name]['ticker']
-            sector = company_knowledge[company_name]['sector']
-            extracted_df.at[index, 'ticker'] = ticker
-            extracted_df.at[index, 'sector'] = sector
-            matched_companies += 1
-        else:
-            unmatched_companies.add(company_name)
+    print(f"Successfully extracted data!")
+    print(f"Original data rows: {total_rows}")
+    print(f"Extracted columns: {available_columns}")
+    if DEBUG:
+        print(f"Output file: {output_file}")
+    print(f"Extracted data rows: {total_rows}")
     
-    # Filter out rows where no ticker was found (跳过找不到的公司)
-    processed_df = extracted_df.dropna(subset=['ticker']).copy()
+    # Display the first few rows of data preview
+    print("\nData preview:")
+    print(preview_df)
     
-    # Save the processed data
-    processed_df.to_csv(processed_output_file, index=False, encoding='utf-8')
+    if DEBUG:
+        # Save the processed data
+        processed_df.to_csv(processed_output_file, index=False, encoding='utf-8')
     
     print(f"\nProcessing summary:")
-    print(f"Total companies processed: {len(extracted_df)}")
+    print(f"Total companies processed: {total_rows}")
     print(f"Companies matched with tickers: {matched_companies}")
-    print(f"Companies skipped (no ticker found): {len(extracted_df) - matched_companies}")
+    print(f"Companies skipped (no ticker found): {total_rows - matched_companies}")
     print(f"Final processed rows: {len(processed_df)}")
-    print(f"Processed data saved to: {processed_output_file}")
+    if DEBUG:
+        print(f"Processed data saved to: {processed_output_file}")
     
     if unmatched_companies:
         try:
@@ -94,38 +134,41 @@ try:
     
     # Create sample data format similar to main.py
     print("\nCreating sample data format (similar to main.py)...")
-    sample_data = []
-    
-    for index, row in processed_df.iterrows():
-        try:
-            # Convert publishedAt to datetime
-            published_date = datetime.fromisoformat(row['publishedAt'].replace('Z', '+00:00'))
-            
-            # Map sentiment value to positive/negative (assuming sentiment > 0 is positive)
-            try:
-                sentiment_value = float(row['sentiment'])
-                sentiment_label = "positive" if sentiment_value > 0 else "negative"
-            except (ValueError, TypeError):
-                sentiment_label = "neutral"  # Default for non-numeric values
-            
-            sample_data.append({
-                'kol_name': row['channel_name'],
-                'ticker': row['ticker'],
-                'sector': row['sector'],
-                'sentiment': sentiment_label,
-                'confidence': float(row['confidence']),
-                'prediction_time': published_date,
-                'video_id': row['video_id'],
-                'title': row['title'],
-                'company': row['company'],
-                'sentiment_score': float(row['sentiment'])
-            })
-        except Exception as e:
-            print(f"Error processing row {index}: {e}")
-            continue
-    
-    # Convert to DataFrame and save as CSV
-    sample_df = pd.DataFrame(sample_data)
+    # Parse the whole publishedAt column at once (ISO-8601, 'Z' or '+00:00' suffix)
+    published_dates = pd.to_datetime(processed_df['publishedAt'], format='ISO8601', utc=True,
+                                     errors='coerce', cache=True)
+    sentiment_scores = pd.to_numeric(processed_df['sentiment'], errors='coerce')
+    
+    # Skip rows whose date cannot be parsed
+    invalid = published_dates.isna()
+    # Report them in one write, at most MAX_LOGGED_ERRORS lines
+    invalid_rows = processed_df.index[invalid]
+    if len(invalid_rows):
+        errors = [f"Error processing row {index}: invalid publishedAt" for index in invalid_rows[:MAX_LOGGED_ERRORS]]
+        if len(invalid_rows) > MAX_LOGGED_ERRORS:
+            errors.append(f"...and {len(invalid_rows) - MAX_LOGGED_ERRORS} more")
+        print("\n".join(errors))
+    valid = ~invalid
+    
+    # Map sentiment value to positive/negative (assuming sentiment > 0 is positive),
+    # neutral for missing or non-numeric values
+    scores = sentiment_scores[valid].to_numpy(dtype='float64')
+    sentiment_labels = np.select([np.isnan(scores), scores > 0], ['neutral', 'positive'], default='negative')
+    
+    sample_df = pd.DataFrame({
+        'kol_name': processed_df['channel_name'][valid],
+        'ticker': processed_df['ticker'][valid],
+        'sector': processed_df['sector'][valid],
+        'sentiment': sentiment_labels,
+        'confidence': processed_df['confidence'][valid].astype('float64'),
+        'prediction_time': published_dates[valid],
+        'video_id': processed_df['video_id'][valid],
+        'title': processed_df['title'][valid],
+        'company': processed_df['company'][valid],
+        'sentiment_score': scores,
+    }).reset_index(drop=True)
+    
+    # Save as CSV
     sample_output_file = 'kol_sample_data.csv'
     sample_df.to_csv(sample_output_file, index=False, encoding='utf-8')
     
@@ -138,8 +181,10 @@ try:
     
     # Also show the tuple format for reference
     print(f"\nFirst 5 records in tuple format (similar to main.py):")
-    for i, data in enumerate(sample_data[:5]):
-        print(f"(\"{data['kol_name']}\", \"{data['ticker']}\", \"{data['sector']}\", \"{data['sentiment']}\", {data['confidence']}, {data['prediction_time']})")
+    preview_columns = ['kol_name', 'ticker', 'sector', 'sentiment', 'confidence', 'prediction_time']
+    for kol_name, ticker, sector, sentiment, confidence, prediction_time in \
+            sample_df[preview_columns].head(5).itertuples(index=False, name=None):
+        print(f"(\"{kol_name}\", \"{ticker}\", \"{sector}\", \"{sentiment}\", {confidence}, {prediction_time})")
     
 except FileNotFoundError:
     print(f"Error: File not found {input_file}")
@@ -3,19 +3,28 @@
 测试yfinance助手工具的功能
 """
 
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-
 from yfinance_helper import YFinanceHelper
+from yfinance_config import price_range
 from datetime import datetime, timedelta
+from unittest import mock
+import os
 import time
+import pandas as pd
+
+_helper = None
+
+def get_helper():
+    """返回所有测试共用的 YFinanceHelper 实例（会话、兼容性检查和延迟配置只做一次）"""
+    global _helper
+    if _helper is None:
+        _helper = YFinanceHelper(delay_min=0.5, delay_max=2.0)
+    return _helper
 
 def test_single_stock():
     """测试单个股票数据获取"""
     print("=== 测试单个股票数据获取 ===")
     
-    helper = YFinanceHelper(delay_min=0.5, delay_max=2.0)
+    helper = get_helper()
     
     # 测试获取AAPL数据
     print("获取AAPL股票数据...")
@@ -24,7 +33,8 @@ def test_single_stock():
     if data is not None:
         print(f"✅ 成功获取AAPL数据，共 {len(data)} 条记录")
         print(f"数据范围: {data.index[0]} 到 {data.index[-1]}")
-        print(f"收盘价范围: ${data['Close'].min():.2f} - ${data['Close'].max():.2f}")
+        low, high = price_range(data['Close'])
+        print(f"收盘价范围: ${low:.2f} - ${high:.2f}")
     else:
         print("❌ 获取AAPL数据失败")
     
@@ -34,7 +44,7 @@ def test_specific_date_price():
     """测试获取特定日期的股票价格"""
     print("\n=== 测试获取特定日期价格 ===")
     
-    helper = YFinanceHelper()
+    helper = get_helper()
     
     # 测试获取特定日期的价格
     target_date = datetime(2024, 1, 15)
@@ -53,13 +63,13 @@ def test_batch_processing():
     """测试批量处理股票数据"""
     print("\n=== 测试批量处理 ===")
     
-    helper = YFinanceHelper(delay_min=0.3, delay_max=1.0)
+    helper = get_helper()
     
     # 测试批量获取多个股票数据
     tickers = ["AAPL", "MSFT", "GOOGL", "TSLA", "NVDA"]
     print(f"批量获取股票数据: {tickers}")
     
-    start_time = time.time()
+    start_time = time.perf_counter_ns()
     batch_data = helper.batch_get_stock_data(
         tickers, 
         "2024-01-01", 
@@ -67,9 +77,9 @@ def test_batch_processing():
         batch_size=2,  # 每批2个
         delay_between_batches=2.0
     )
-    end_time = time.time()
+    elapsed = (time.perf_counter_ns() - start_time) / 1e9
     
-    print(f"批量处理完成，耗时: {end_time - start_time:.1f} 秒")
+    print(f"批量处理完成，耗时: {elapsed:.1f} 秒")
     
     success_count = 0
     for ticker in tickers:
@@ -87,19 +97,19 @@ def test_cache_functionality():
     """测试缓存功能"""
     print("\n=== 测试缓存功能 ===")
     
-    helper = YFinanceHelper()
+    helper = get_helper()
     
     # 第一次获取（应该从API获取）
     print("第一次获取MSFT数据（从API）...")
-    start_time = time.time()
+    start_time = time.perf_counter_ns()
     data1 = helper.get_stock_data("MSFT", "2024-01-01", "2024-01-15")
-    time1 = time.time() - start_time
+    time1 = (time.perf_counter_ns() - start_time) / 1e9
     
     # 第二次获取（应该从缓存获取）
     print("第二次获取MSFT数据（从缓存）...")
-    start_time = time.time()
+    start_time = time.perf_counter_ns()
     data2 = helper.get_stock_data("MSFT", "2024-01-01", "2024-01-15")
-    time2 = time.time() - start_time
+    time2 = (time.perf_counter_ns() - start_time) / 1e9
     
     if data1 is not None and data2 is not None:
         print(f"✅ 缓存功能正常")
@@ -110,11 +120,34 @@ def test_cache_functionality():
         print("❌ 缓存功能测试失败")
         return False
 
+def test_memory_cache_hit_skips_io():
+    """测试内存缓存命中时不访问缓存目录（不调用 os.scandir / stat）"""
+    print("\n=== 测试内存缓存命中 ===")
+    
+    helper = get_helper()
+    
+    # 直接写入内存缓存，不需要网络
+    frame = pd.DataFrame({'Close': [1.0, 2.0]}, index=pd.to_datetime(['2024-01-02', '2024-01-03']))
+    for ticker in ("MEMA", "MEMB"):
+        helper._mem_cache_put((ticker, "2024-01-01", "2024-01-05"), frame)
+    
+    with mock.patch.object(os, "scandir", side_effect=AssertionError("os.scandir")) as scandir, \
+         mock.patch.object(os, "stat", side_effect=AssertionError("os.stat")) as stat:
+        single = helper.get_stock_data("MEMA", "2024-01-01", "2024-01-05")
+        batch = helper.batch_get_stock_data(["MEMA", "MEMB"], "2024-01-01", "2024-01-05")
+    
+    if single is frame and set(batch) == {"MEMA", "MEMB"} and not scandir.called and not stat.called:
+        print("✅ 内存缓存命中时没有文件系统访问")
+        return True
+    else:
+        print("❌ 内存缓存命中时仍访问了缓存目录")
+        return False
+
 def test_error_handling():
     """测试错误处理"""
     print("\n=== 测试错误处理 ===")
     
-    helper = YFinanceHelper()
+    helper = get_helper()
     
     # 测试无效的股票代码
     print("测试无效股票代码...")
@@ -136,6 +169,7 @@ def test_integration_with_kolsentiment():
         
         # 创建测试数据库
         db = KOLSentimentDB("test_yfinance_helper.db")
+        db.yf_helper = get_helper()
         
         # 测试获取股票价格
         test_date = datetime(2024, 1, 15)
@@ -170,6 +204,7 @@ def main():
         ("特定日期价格获取", test_specific_date_price),
         ("批量处理", test_batch_processing),
         ("缓存功能", test_cache_functionality),
+        ("内存缓存命中", test_memory_cache_hit_skips_io),
         ("错误处理", test_error_handling),
         ("KOLSentiment集成", test_integration_with_kolsentiment),
     ]
@@ -2,6 +2,33 @@
 yfinance API 配置和最佳实践设置
 """
 
+import hashlib
+import inspect
+import itertools
+import os
+import pickle
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from types import MappingProxyType
+
+import numpy as np
+import pandas as pd
+
+try:
+    import yfinance as yf
+    # yf.download() 的参数只在导入时探测一次，各处直接查表
+    DOWNLOAD_PARAMS = tuple(inspect.signature(yf.download).parameters)
+except Exception:  # yfinance 未安装或签名不可用
+    DOWNLOAD_PARAMS = ()
+
+_PARAMS = frozenset(DOWNLOAD_PARAMS)
+
+# 关键参数支持情况
+SUPPORTS = {p: p in _PARAMS for p in ('show_errors', 'session', 'threads', 'progress', 'group_by')}
+
 # 速率限制配置
 RATE_LIMIT_CONFIG = {
     # 请求间延迟（秒）
@@ -19,14 +46,72 @@ RATE_LIMIT_CONFIG = {
     "cache_ttl_hours": 24, # 缓存有效期（小时）
 }
 
+class TokenBucket:
+    """
+    令牌桶限速器（线程安全）
+    
+    令牌以 rate 个/秒的速度补充，最多累积 burst 个；请求到来时有令牌就立即放行，
+    没有则只等待到下一个令牌可用，而不是固定地随机休眠。
+    遇到速率限制时调用 penalize()，所有共用该令牌桶的线程一起暂停。
+    """
+    
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """取得一个令牌，必要时阻塞等待"""
+        with self._lock:
+            now = time.monotonic()
+            # 暂停期间不补充令牌（penalize 已把 _last 推到暂停结束时刻）
+            if now > self._last:
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+            # 先预占令牌（可以为负），并发调用者按到达顺序排队等待；
+            # 暂停期间到达的请求在暂停结束后依次错开，而不是同时放行
+            self._tokens -= 1
+            deficit = -self._tokens if self._tokens < 0 else 0.0
+            wait = max(0.0, self._blocked_until - now) + deficit / self.rate
+        if wait > 0:
+            time.sleep(wait)
+    
+    def penalize(self, seconds: float):
+        """在接下来 seconds 秒内暂停发放令牌（全局退避），清空已累积的突发额度，暂停期间也不补充令牌"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._tokens = min(self._tokens, 0.0)
+            self._last = max(self._last, self._blocked_until)
+
+# 全局限速：平均每 delay_min 秒一个请求，允许 batch_size 个突发
+BUCKET = TokenBucket(rate=1 / RATE_LIMIT_CONFIG["delay_min"], burst=RATE_LIMIT_CONFIG["batch_size"])
+
+def _is_rate_limited(error: Exception) -> bool:
+    """判断异常是否为可重试的速率限制/服务端错误"""
+    message = str(error)
+    if "Too Many Requests" in message or "Rate limited" in message:
+        return True
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status in RATE_LIMIT_CONFIG["retry_statuses"]
+
 # 用户代理配置（避免被识别为爬虫）
-USER_AGENTS = [
+USER_AGENTS = (
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
     'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
     'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0',
     'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:89.0) Gecko/20100101 Firefox/89.0',
-]
+)
+
+# 轮换使用 User-Agent，每次调用取下一个
+_UA_CYCLE = itertools.cycle(USER_AGENTS)
+
+def next_user_agent() -> str:
+    """返回轮换中的下一个 User-Agent"""
+    return next(_UA_CYCLE)
 
 # API限制说明和解决方案
 API_LIMITS_INFO = """
@@ -114,35 +199,216 @@ def print_api_info():
     print(BEST_PRACTICES)
 
 def check_yfinance_version():
-    """检查yfinance版本兼容性"""
-    try:
-        import yfinance as yf
-        import inspect
-        
-        print(f"yfinance版本: {getattr(yf, '__version__', '未知')}")
-        
-        # 检查关键参数支持
-        download_signature = inspect.signature(yf.download)
-        params = download_signature.parameters
-        
-        critical_params = {
-            'show_errors': 'show_errors' in params,
-            'session': 'session' in params,
-            'threads': 'threads' in params,
-            'progress': 'progress' in params,
-            'group_by': 'group_by' in params,
-        }
-        
-        print("参数支持情况:")
-        for param, supported in critical_params.items():
-            status = "✅" if supported else "❌"
-            print(f"  {param}: {status}")
-        
-        return critical_params
-        
-    except Exception as e:
-        print(f"版本检查失败: {e}")
+    """检查yfinance版本兼容性（使用导入时探测的 SUPPORTS）"""
+    if not DOWNLOAD_PARAMS:
+        print("版本检查失败: 无法获取 yf.download() 参数")
         return {}
+    
+    print(f"yfinance版本: {getattr(yf, '__version__', '未知')}")
+    
+    print("参数支持情况:")
+    for param, supported in SUPPORTS.items():
+        status = "✅" if supported else "❌"
+        print(f"  {param}: {status}")
+    
+    return SUPPORTS
+
+# yf.download() 结果的本地缓存目录
+# 新版 yfinance 会拒绝 requests_cache 之类的缓存会话，因此在结果层面缓存 DataFrame
+DOWNLOAD_CACHE_DIR = os.path.join("yfinance_cache", "download")
+
+def _download_cache_path(tickers, kwargs) -> str:
+    """根据 tickers 和下载参数生成缓存文件路径"""
+    if not isinstance(tickers, str):
+        tickers = tuple(sorted(tickers))
+    key = repr((tickers, sorted(kwargs.items())))
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return os.path.join(DOWNLOAD_CACHE_DIR, f"{digest}.pkl")
+
+# 正在进行中的下载：缓存路径 -> Future，同一请求的并发调用共享一次网络访问
+_INFLIGHT = {}
+_INFLIGHT_LOCK = threading.Lock()
+
+def cached_download(tickers, **kwargs):
+    """
+    带本地缓存的 yf.download()
+    
+    相同 tickers 和参数的结果在 cache_ttl_hours 内直接从磁盘读取，
+    跨测试、跨运行都不再重复请求网络；空结果不缓存。
+    多个线程同时请求同一份未缓存数据时只有第一个线程真正下载，其余线程等待其结果。
+    
+    Args:
+        tickers: 股票代码或代码列表
+        **kwargs: 传给 yf.download() 的参数
+    
+    Returns:
+        yf.download() 返回的 DataFrame
+    """
+    cache_path = _download_cache_path(tickers, kwargs)
+    
+    with _INFLIGHT_LOCK:
+        future = _INFLIGHT.get(cache_path)
+        leader = future is None
+        if leader:
+            future = _INFLIGHT[cache_path] = Future()
+    
+    if not leader:
+        return future.result()
+    
+    try:
+        data = _load_or_download(cache_path, tickers, kwargs)
+        future.set_result(data)
+        return data
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _INFLIGHT_LOCK:
+            del _INFLIGHT[cache_path]
+
+def _load_or_download(cache_path, tickers, kwargs):
+    """读取未过期的缓存，否则调用 yf.download() 并写入缓存"""
+    ttl = RATE_LIMIT_CONFIG["cache_ttl_hours"] * 3600
+    
+    try:
+        if time.time() - os.path.getmtime(cache_path) < ttl:
+            with open(cache_path, 'rb') as f:
+                return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+    
+    data = _throttled_download(tickers, kwargs)
+    
+    if data is not None and not data.empty:
+        try:
+            os.makedirs(DOWNLOAD_CACHE_DIR, exist_ok=True)
+            with open(cache_path, 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            print(f"缓存保存失败: {e}")
+    
+    return data
+
+def _throttled_download(tickers, kwargs):
+    """经令牌桶限速调用 yf.download()，遇到速率限制时按指数退避重试"""
+    max_retries = RATE_LIMIT_CONFIG["max_retries"]
+    for attempt in range(max_retries + 1):
+        BUCKET.acquire()
+        try:
+            return yf.download(tickers, **kwargs)
+        except Exception as e:
+            if attempt == max_retries or not _is_rate_limited(e):
+                raise
+            wait_time = RATE_LIMIT_CONFIG["delay_min"] * RATE_LIMIT_CONFIG["backoff_factor"] ** attempt
+            print(f"速率限制: 等待 {wait_time:.1f} 秒后重试...")
+            BUCKET.penalize(wait_time)  # 下一次 acquire() 会等待，其他线程也一起退避
+
+def price_range(close):
+    """
+    返回收盘价的 (最低价, 最高价)
+    
+    直接在同一块 NumPy 缓冲区上做两次归约；新版 yf.download() 单个股票也返回
+    多级列，此时 data['Close'] 是单列 DataFrame，同样适用。
+    """
+    values = np.asarray(close, dtype=float)
+    return float(np.nanmin(values)), float(np.nanmax(values))
+
+def assemble(per_ticker):
+    """
+    把 {股票代码: DataFrame} 一次性合并成按股票代码分组的多级列 DataFrame
+    
+    先收集、最后只 concat 一次；在循环里反复 pd.concat 每次都会复制已有数据，总开销是 O(n²)。
+    
+    Args:
+        per_ticker: batch_get_stock_data() 等返回的字典
+    
+    Returns:
+        列为 (股票代码, 字段) 的 DataFrame，与 yf.download(group_by='ticker') 的布局一致
+    """
+    if not per_ticker:
+        return pd.DataFrame()
+    return pd.concat(list(per_ticker.values()), keys=list(per_ticker.keys()), axis=1)
+
+class _ThreadBufferedStdout:
+    """stdout 代理：处于 captured_output() 中的线程写入自己的缓冲区，其余线程直接透传"""
+    
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+    
+    def write(self, text):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            return self._stream.write(text)
+        buffer.append(text)
+        return len(text)
+    
+    def flush(self):
+        if getattr(self._local, "buffer", None) is None:
+            self._stream.flush()
+    
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+_stdout_lock = threading.Lock()
+_stdout_users = 0  # 当前处于 captured_output() 中的线程数，归零时还原 sys.stdout
+
+@contextmanager
+def captured_output():
+    """
+    收集当前线程内的 print 输出，而不是逐行写到终端
+    
+    yield 出一个列表，退出时里面是完整的输出文本（单个字符串），调用方可以一次性写出；
+    并发运行的测试各自缓冲，输出不会交错。只收集调用线程本身的输出，
+    YFinanceHelper 内部线程池的输出不在缓冲区内，会直接写到终端。
+    最后一个 captured_output() 退出时还原原来的 sys.stdout。
+    """
+    global _stdout_users
+    with _stdout_lock:
+        if _stdout_users == 0:
+            sys.stdout = _ThreadBufferedStdout(sys.stdout)
+        _stdout_users += 1
+        proxy = sys.stdout
+    
+    buffer = proxy._local.buffer = []
+    result = []
+    try:
+        yield result
+    finally:
+        proxy._local.buffer = None
+        result.append("".join(buffer))
+        with _stdout_lock:
+            _stdout_users -= 1
+            if _stdout_users == 0:
+                sys.stdout = proxy._stream
+
+# 各使用场景的推荐配置（只读，模块导入时构建一次）
+_CONFIGS = MappingProxyType({
+    "light": MappingProxyType({  # 轻度使用：偶尔查询几个股票
+        "delay_min": 0.5,
+        "delay_max": 1.5,
+        "batch_size": 3,
+        "max_retries": 2,
+    }),
+    "normal": MappingProxyType({  # 正常使用：日常分析和回测
+        "delay_min": 1.0,
+        "delay_max": 3.0,
+        "batch_size": 5,
+        "max_retries": 3,
+    }),
+    "heavy": MappingProxyType({   # 重度使用：大量数据分析
+        "delay_min": 2.0,
+        "delay_max": 5.0,
+        "batch_size": 3,
+        "max_retries": 5,
+    }),
+    "batch": MappingProxyType({   # 批量处理：数据收集和研究
+        "delay_min": 3.0,
+        "delay_max": 8.0,
+        "batch_size": 2,
+        "max_retries": 5,
+    }),
+})
 
 def get_recommended_config(usage_type="normal"):
     """
@@ -152,36 +418,9 @@ def get_recommended_config(usage_type="normal"):
         usage_type: 使用类型 ("light", "normal", "heavy", "batch")
     
     Returns:
-        配置字典
+        只读的配置映射（各调用方共享同一实例，不可修改）
     """
-    configs = {
-        "light": {  # 轻度使用：偶尔查询几个股票
-            "delay_min": 0.5,
-            "delay_max": 1.5,
-            "batch_size": 3,
-            "max_retries": 2,
-        },
-        "normal": {  # 正常使用：日常分析和回测
-            "delay_min": 1.0,
-            "delay_max": 3.0,
-            "batch_size": 5,
-            "max_retries": 3,
-        },
-        "heavy": {   # 重度使用：大量数据分析
-            "delay_min": 2.0,
-            "delay_max": 5.0,
-            "batch_size": 3,
-            "max_retries": 5,
-        },
-        "batch": {   # 批量处理：数据收集和研究
-            "delay_min": 3.0,
-            "delay_max": 8.0,
-            "batch_size": 2,
-            "max_retries": 5,
-        }
-    }
-    
-    return configs.get(usage_type, configs["normal"])
+    return _CONFIGS.get(usage_type, _CONFIGS["normal"])
 
 if __name__ == "__main__":
     print_api_info()
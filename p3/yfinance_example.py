@@ -5,7 +5,7 @@ yfinance助手工具使用示例
 """
 
 from yfinance_helper import YFinanceHelper
-from yfinance_config import get_recommended_config, print_api_info
+from yfinance_config import get_recommended_config, price_range, print_api_info
 from datetime import datetime, timedelta
 import time
 
@@ -22,7 +22,8 @@ def example_basic_usage():
     
     if data is not None:
         print(f"✅ 成功获取 {len(data)} 条AAPL数据")
-        print(f"价格范围: ${data['Close'].min():.2f} - ${data['Close'].max():.2f}")
+        low, high = price_range(data['Close'])
+        print(f"价格范围: ${low:.2f} - ${high:.2f}")
     else:
         print("❌ 获取数据失败")
 
@@ -41,7 +42,7 @@ def example_batch_processing():
     tickers = ["AAPL", "MSFT", "GOOGL", "AMZN", "TSLA"]
     
     print(f"批量获取 {len(tickers)} 只股票的数据（使用yf.download批量功能）...")
-    start_time = time.time()
+    start_time = time.perf_counter_ns()
     
     batch_data = helper.batch_get_stock_data(
         tickers,
@@ -52,7 +53,7 @@ def example_batch_processing():
         use_bulk_download=True  # 使用yf.download的批量下载功能
     )
     
-    elapsed = time.time() - start_time
+    elapsed = (time.perf_counter_ns() - start_time) / 1e9
     print(f"批量处理完成，耗时: {elapsed:.1f} 秒")
     
     # 显示结果
@@ -66,7 +67,7 @@ def example_batch_processing():
     
     # 对比传统方法
     print(f"\n🔄 对比传统逐个下载方法...")
-    start_time = time.time()
+    start_time = time.perf_counter_ns()
     
     individual_data = helper.batch_get_stock_data(
         tickers[:3],  # 只测试前3个避免太久
@@ -76,7 +77,7 @@ def example_batch_processing():
         use_bulk_download=False  # 使用传统逐个下载
     )
     
-    elapsed_individual = time.time() - start_time
+    elapsed_individual = (time.perf_counter_ns() - start_time) / 1e9
     print(f"传统方法耗时: {elapsed_individual:.1f} 秒")
     
     if elapsed_individual > 0:
@@ -147,18 +148,18 @@ def example_cache_demo():
     
     # 第一次请求（从API获取）
     print("第一次请求（从API获取）...")
-    start_time = time.time()
+    start_time = time.perf_counter_ns()
     data1 = helper.get_stock_data(ticker, start_date, end_date)
-    time1 = time.time() - start_time
+    time1 = (time.perf_counter_ns() - start_time) / 1e9
     
     if data1 is not None:
         print(f"✅ 第一次请求成功，耗时: {time1:.2f} 秒")
         
         # 第二次请求（从缓存获取）
         print("第二次请求（从缓存获取）...")
-        start_time = time.time()
+        start_time = time.perf_counter_ns()
         data2 = helper.get_stock_data(ticker, start_date, end_date)
-        time2 = time.time() - start_time
+        time2 = (time.perf_counter_ns() - start_time) / 1e9
         
         if data2 is not None:
             print(f"✅ 第二次请求成功，耗时: {time2:.2f} 秒")
@@ -1,3 +1,4 @@
+import asyncio
 import yfinance as yf
 import time
 import random
@@ -5,11 +6,65 @@ import pandas as pd
 from datetime import datetime, timedelta
 import pickle
 import os
-import inspect
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional, Tuple
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+from yfinance_config import BUCKET, SUPPORTS, next_user_agent
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # 未安装 pyarrow 时退回 pickle 缓存
+    pa = None
+    feather = None
+
+# 新缓存的写入格式：有 pyarrow 时用 Feather（列式、可内存映射读取），否则用 pickle
+CACHE_SUFFIX = '.feather' if feather is not None else '.pkl'
+# 可以读取的缓存格式（按优先级），旧的 .pkl 缓存始终可读
+READABLE_SUFFIXES = ('.feather', '.pkl') if feather is not None else ('.pkl',)
+
+# 内存缓存：最多保存的条目数和有效期（秒）
+MEM_CACHE_MAX = 256
+MEM_CACHE_TTL = 3600
+
+def nearest_close(data: pd.DataFrame, target_date: datetime, days_buffer: Optional[int] = None) -> Optional[float]:
+    """
+    取目标日期当天的收盘价，当天没有交易时取最接近的交易日（等距时取较早的交易日）
+    
+    get_stock_price_on_date 和 KOLSentiment 的预取历史共用这一规则，两条路径得到的价格一致。
+    收盘价为 NaN 的行会被跳过，不修改传入的 DataFrame。
+    
+    Args:
+        data: 价格数据（DatetimeIndex 已排序）
+        target_date: 目标日期
+        days_buffer: 最接近的交易日与目标日期最多相差的天数，None 表示不限制
+        
+    Returns:
+        收盘价，没有符合条件的数据返回None
+    """
+    close = data['Close']
+    if isinstance(close, pd.DataFrame):  # 多级列时 data['Close'] 是单列 DataFrame
+        close = close.iloc[:, 0]
+    close = close.dropna()
+    if close.empty:
+        return None
+    
+    target = pd.Timestamp(target_date).normalize()
+    if close.index.tz is not None:
+        target = target.tz_localize(close.index.tz)
+    # 在已排序的 DatetimeIndex 上二分查找：searchsorted 给出右侧邻居，再和左侧邻居比较距离
+    index = close.index.normalize()
+    pos = int(index.searchsorted(target))
+    if pos == len(index) or (pos > 0 and target - index[pos - 1] <= index[pos] - target):
+        pos -= 1
+    
+    if days_buffer is not None and abs((index[pos] - target).days) > days_buffer:
+        return None
+    return float(close.iat[pos])
 
 class YFinanceHelper:
     """
@@ -30,6 +85,10 @@ class YFinanceHelper:
         self.delay_max = delay_max
         self.session = None
         
+        # 磁盘缓存之上的 LRU 内存缓存：(ticker, start, end) -> (写入时间, DataFrame)
+        self._mem_cache = OrderedDict()
+        self._mem_cache_lock = threading.Lock()
+        
         # 创建缓存目录
         if not os.path.exists(cache_dir):
             os.makedirs(cache_dir)
@@ -39,6 +98,13 @@ class YFinanceHelper:
         
         # 检查yfinance版本兼容性
         self._check_yfinance_compatibility()
+        
+        # 每次下载都相同的可选参数只计算一次
+        self._static_kwargs = {}
+        if self.supports_show_errors:
+            self._static_kwargs['show_errors'] = False
+        if self.supports_session and self.session:
+            self._static_kwargs['session'] = self.session
     
     def _setup_session(self):
         """设置带重试机制的会话"""
@@ -57,15 +123,16 @@ class YFinanceHelper:
         
         # 设置User-Agent避免被识别为爬虫
         self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+            'User-Agent': next_user_agent()
         })
     
     def _check_yfinance_compatibility(self):
         """检查yfinance版本兼容性"""
         try:
-            download_signature = inspect.signature(yf.download)
-            self.supports_show_errors = 'show_errors' in download_signature.parameters
-            self.supports_session = 'session' in download_signature.parameters
+            # 参数支持情况在 yfinance_config 导入时已探测，这里只绑定一次
+            self._supports = SUPPORTS
+            self.supports_show_errors = SUPPORTS['show_errors']
+            self.supports_session = SUPPORTS['session']
             
             print(f"yfinance兼容性检查:")
             print(f"  - show_errors参数: {'✅ 支持' if self.supports_show_errors else '❌ 不支持'}")
@@ -76,48 +143,223 @@ class YFinanceHelper:
             self.supports_session = False
     
     def _get_download_kwargs(self, base_kwargs: dict) -> dict:
-        """根据yfinance版本获取兼容的下载参数"""
-        kwargs = base_kwargs.copy()
-        
-        # 添加可选参数
-        if self.supports_show_errors:
-            kwargs['show_errors'] = False
-        
-        if self.supports_session and self.session:
-            kwargs['session'] = self.session
-        
-        return kwargs
+        """根据yfinance版本获取兼容的下载参数（返回新字典，不修改 base_kwargs）"""
+        return {**base_kwargs, **self._static_kwargs}
     
-    def _get_cache_path(self, ticker: str, start_date: str, end_date: str) -> str:
+    def _get_cache_path(self, ticker: str, start_date: str, end_date: str,
+                        suffix: str = CACHE_SUFFIX) -> str:
         """获取缓存文件路径"""
-        cache_filename = f"{ticker}_{start_date}_{end_date}.pkl"
+        cache_filename = f"{ticker}_{start_date}_{end_date}{suffix}"
         return os.path.join(self.cache_dir, cache_filename)
     
-    def _load_from_cache(self, ticker: str, start_date: str, end_date: str) -> Optional[pd.DataFrame]:
-        """从缓存加载数据"""
-        cache_path = self._get_cache_path(ticker, start_date, end_date)
+    @staticmethod
+    def _read_cache_file(cache_path: str) -> pd.DataFrame:
+        """按文件后缀读取缓存（Feather 使用内存映射，避免逐个重建 Python 对象）"""
+        if cache_path.endswith('.feather'):
+            table = feather.read_table(cache_path, memory_map=True)
+            return table.to_pandas(split_blocks=True, self_destruct=True)
+        with open(cache_path, 'rb') as f:
+            return pickle.load(f)
+    
+    @staticmethod
+    def _write_cache_file(cache_path: str, data: pd.DataFrame):
+        """按文件后缀写入缓存"""
+        if cache_path.endswith('.feather'):
+            table = pa.Table.from_pandas(data, preserve_index=True)
+            feather.write_feather(table, cache_path, compression='lz4')
+        else:
+            with open(cache_path, 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    
+    def _mem_cache_get(self, key: Tuple[str, str, str]) -> Optional[pd.DataFrame]:
+        """查找内存缓存，命中时移到最近使用的位置"""
+        with self._mem_cache_lock:
+            entry = self._mem_cache.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] >= MEM_CACHE_TTL:
+                del self._mem_cache[key]
+                return None
+            self._mem_cache.move_to_end(key)
+            return entry[1]
+    
+    def _mem_cache_put(self, key: Tuple[str, str, str], data: pd.DataFrame):
+        """写入内存缓存，超出容量时淘汰最久未使用的条目"""
+        with self._mem_cache_lock:
+            self._mem_cache[key] = (time.time(), data)
+            self._mem_cache.move_to_end(key)
+            while len(self._mem_cache) > MEM_CACHE_MAX:
+                self._mem_cache.popitem(last=False)
+    
+    def _scan_cache_dir(self) -> Dict[str, float]:
+        """一次 os.scandir 取得缓存目录快照：文件名 -> 修改时间"""
+        try:
+            with os.scandir(self.cache_dir) as entries:
+                return {entry.name: entry.stat().st_mtime for entry in entries if entry.is_file()}
+        except FileNotFoundError:
+            return {}
+    
+    def _load_from_cache(self, ticker: str, start_date: str, end_date: str,
+                         snapshot: Optional[Dict[str, float]] = None) -> Optional[pd.DataFrame]:
+        """
+        从缓存加载数据（精确匹配优先，其次使用覆盖该区间的缓存切片）
         
-        if os.path.exists(cache_path):
+        Args:
+            snapshot: _scan_cache_dir() 的结果；批量查找时传入同一份快照，
+                      用字典查找代替每个股票的 exists/getmtime/listdir
+        """
+        key = (ticker, start_date, end_date)
+        data = self._mem_cache_get(key)
+        if data is not None:
+            return data
+        
+        if snapshot is None:
+            snapshot = self._scan_cache_dir()
+        
+        for suffix in READABLE_SUFFIXES:
+            cache_path = self._get_cache_path(ticker, start_date, end_date, suffix)
+            mtime = snapshot.get(os.path.basename(cache_path))
+            if mtime is None:
+                continue
             try:
-                # 检查缓存文件是否过期（1天）
-                cache_time = os.path.getmtime(cache_path)
-                if time.time() - cache_time < 24 * 3600:  # 24小时内的缓存有效
-                    with open(cache_path, 'rb') as f:
-                        data = pickle.load(f)
+                if self._is_cache_fresh(cache_path, end_date, mtime):
+                    data = self._read_cache_file(cache_path)
                     print(f"从缓存加载 {ticker} 数据")
+                    self._mem_cache_put(key, data)
                     return data
             except Exception as e:
                 print(f"缓存加载失败: {e}")
         
+        data = self._load_from_covering_cache(ticker, start_date, end_date, snapshot)
+        if data is not None:
+            self._mem_cache_put(key, data)
+        return data
+    
+    def _is_cache_fresh(self, cache_path: str, end_date: str, cache_time: Optional[float] = None) -> bool:
+        """
+        检查缓存是否仍然有效
+        
+        写入缓存时区间已经结束一天以上的数据是历史价格，不会再变化，永久有效；
+        包含最近交易日的缓存仍按24小时过期（数据可能被修正）
+        """
+        if cache_time is None:
+            cache_time = os.path.getmtime(cache_path)
+        window_closed = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+        if datetime.fromtimestamp(cache_time) >= window_closed:
+            return True
+        return time.time() - cache_time < 24 * 3600
+    
+    @staticmethod
+    def _iter_ticker_cache(ticker: str, snapshot: Dict[str, float]):
+        """遍历快照中某只股票的缓存文件，产出 (起始日期, 结束日期, 文件名, 修改时间)"""
+        prefix = f"{ticker}_"
+        for filename, mtime in snapshot.items():
+            if not filename.startswith(prefix):
+                continue
+            stem, suffix = os.path.splitext(filename)
+            if suffix not in READABLE_SUFFIXES:
+                continue
+            parts = stem[len(prefix):].split('_')
+            if len(parts) != 2:
+                continue
+            yield parts[0], parts[1], filename, mtime
+    
+    def _load_from_covering_cache(self, ticker: str, start_date: str, end_date: str,
+                                  snapshot: Dict[str, float]) -> Optional[pd.DataFrame]:
+        """查找覆盖 [start_date, end_date) 的同一股票缓存，并在内存中切片"""
+        for cached_start, cached_end, filename, mtime in self._iter_ticker_cache(ticker, snapshot):
+            # 日期均为 YYYY-MM-DD 格式，可以直接按字符串比较
+            if cached_start > start_date or cached_end < end_date:
+                continue
+            
+            cache_path = os.path.join(self.cache_dir, filename)
+            try:
+                if not self._is_cache_fresh(cache_path, cached_end, mtime):
+                    continue
+                data = self._read_cache_file(cache_path)
+                print(f"从缓存加载 {ticker} 数据 (切片自 {cached_start} 到 {cached_end})")
+                return self._slice_date_range(data, start_date, end_date)
+            except Exception as e:
+                print(f"缓存加载失败: {e}")
+        
         return None
     
+    def _find_overlapping_cache(self, ticker: str, start_date: str, end_date: str,
+                                snapshot: Dict[str, float]) -> Optional[Tuple[str, str, str]]:
+        """查找与 [start_date, end_date) 重叠或相邻的有效缓存，返回 (起始日期, 结束日期, 文件名)"""
+        for cached_start, cached_end, filename, mtime in self._iter_ticker_cache(ticker, snapshot):
+            if cached_start > end_date or cached_end < start_date:
+                continue
+            if self._is_cache_fresh(os.path.join(self.cache_dir, filename), cached_end, mtime):
+                return cached_start, cached_end, filename
+        return None
+    
+    def _extend_cached_range(self, ticker: str, start_date: str, end_date: str,
+                             existing: Tuple[str, str, str], max_retries: int) -> Optional[pd.DataFrame]:
+        """
+        只下载缓存区间之外缺少的部分，与已有缓存合并成一个连续区间的文件
+        
+        每只股票的相邻/重叠请求最终合并为一个缓存文件，后续在其范围内的查询都直接切片。
+        任一缺口下载失败时返回 None，由调用方退回整段下载。
+        """
+        cached_start, cached_end, filename = existing
+        old_path = os.path.join(self.cache_dir, filename)
+        try:
+            cached = self._read_cache_file(old_path)
+        except Exception as e:
+            print(f"缓存加载失败: {e}")
+            return None
+        
+        missing = []
+        if start_date < cached_start:
+            missing.append((start_date, cached_start))
+        if end_date > cached_end:
+            missing.append((cached_end, end_date))
+        print(f"扩展 {ticker} 缓存 ({cached_start} 到 {cached_end})，补充下载: {missing}")
+        
+        pieces = [cached]
+        for window_start, window_end in missing:
+            part = self._download_with_retry(ticker, window_start, window_end, max_retries, allow_empty=True)
+            if part is None:
+                return None
+            if part.empty:
+                continue
+            if not part.columns.equals(cached.columns):
+                # 批量下载与单独下载的列结构不同（单级/多级列），无法直接拼接
+                return None
+            pieces.append(part)
+        
+        merged = pd.concat(pieces).sort_index()
+        merged = merged[~merged.index.duplicated(keep='last')]
+        
+        new_start = min(start_date, cached_start)
+        new_end = max(end_date, cached_end)
+        self._save_to_cache(ticker, new_start, new_end, merged)
+        if os.path.basename(self._get_cache_path(ticker, new_start, new_end)) != filename:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+        
+        return self._slice_date_range(merged, start_date, end_date)
+    
+    @staticmethod
+    def _slice_date_range(data: pd.DataFrame, start_date: str, end_date: str) -> pd.DataFrame:
+        """按 yf.download 的语义截取 [start_date, end_date) 区间"""
+        start = pd.Timestamp(start_date)
+        end = pd.Timestamp(end_date)
+        if data.index.tz is not None:
+            start = start.tz_localize(data.index.tz)
+            end = end.tz_localize(data.index.tz)
+        return data[(data.index >= start) & (data.index < end)]
+    
     def _save_to_cache(self, ticker: str, start_date: str, end_date: str, data: pd.DataFrame):
-        """保存数据到缓存"""
+        """保存数据到缓存（同时写入内存缓存和磁盘）"""
+        self._mem_cache_put((ticker, start_date, end_date), data)
         cache_path = self._get_cache_path(ticker, start_date, end_date)
         
         try:
-            with open(cache_path, 'wb') as f:
-                pickle.dump(data, f)
+            self._write_cache_file(cache_path, data)
             print(f"缓存保存 {ticker} 数据")
         except Exception as e:
             print(f"缓存保存失败: {e}")
@@ -128,7 +370,8 @@ class YFinanceHelper:
         time.sleep(delay)
     
     def get_stock_data(self, ticker: str, start_date: str, end_date: str, 
-                       max_retries: int = 3) -> Optional[pd.DataFrame]:
+                       max_retries: int = 3,
+                       snapshot: Optional[Dict[str, float]] = None) -> Optional[pd.DataFrame]:
         """
         获取股票数据（带缓存和重试机制）- 使用yf.download()
         
@@ -137,16 +380,44 @@ class YFinanceHelper:
             start_date: 开始日期 (YYYY-MM-DD)
             end_date: 结束日期 (YYYY-MM-DD)
             max_retries: 最大重试次数
+            snapshot: 可选的缓存目录快照（_scan_cache_dir() 的结果），批量调用时复用
             
         Returns:
             股票数据DataFrame，失败返回None
         """
-        # 先尝试从缓存加载
-        cached_data = self._load_from_cache(ticker, start_date, end_date)
+        # 内存缓存命中时直接返回，不访问缓存目录
+        cached_data = self._mem_cache_get((ticker, start_date, end_date))
+        if cached_data is not None:
+            return cached_data
+        
+        # 再尝试从磁盘缓存加载
+        if snapshot is None:
+            snapshot = self._scan_cache_dir()
+        cached_data = self._load_from_cache(ticker, start_date, end_date, snapshot)
         if cached_data is not None:
             return cached_data
         
-        # 从API获取数据
+        # 与已有缓存部分重叠时只下载缺少的区间
+        existing = self._find_overlapping_cache(ticker, start_date, end_date, snapshot)
+        if existing is not None:
+            data = self._extend_cached_range(ticker, start_date, end_date, existing, max_retries)
+            if data is not None:
+                return data
+        
+        data = self._download_with_retry(ticker, start_date, end_date, max_retries)
+        if data is not None:
+            # 保存到缓存
+            self._save_to_cache(ticker, start_date, end_date, data)
+        return data
+    
+    def _download_with_retry(self, ticker: str, start_date: str, end_date: str,
+                             max_retries: int = 3, allow_empty: bool = False) -> Optional[pd.DataFrame]:
+        """
+        从API获取数据（带重试机制，不读写缓存）
+        
+        Args:
+            allow_empty: 为 True 时空结果直接返回（补充下载的区间可能没有交易日）
+        """
         for attempt in range(max_retries):
             try:
                 print(f"获取 {ticker} 数据 (尝试 {attempt + 1}/{max_retries})...")
@@ -164,11 +435,10 @@ class YFinanceHelper:
                 }
                 
                 download_kwargs = self._get_download_kwargs(base_kwargs)
+                BUCKET.acquire()  # 所有线程/协程共用的全局限速
                 data = yf.download(ticker, **download_kwargs)
                 
-                if not data.empty:
-                    # 保存到缓存
-                    self._save_to_cache(ticker, start_date, end_date, data)
+                if not data.empty or allow_empty:
                     print(f"成功获取 {ticker} 数据 ({len(data)} 条记录)")
                     return data
                 else:
@@ -179,7 +449,8 @@ class YFinanceHelper:
                 if "Too Many Requests" in error_msg or "Rate limited" in error_msg or "429" in error_msg:
                     wait_time = (2 ** attempt) + random.uniform(1, 3)
                     print(f"速率限制: {ticker} - 等待 {wait_time:.1f} 秒后重试...")
-                    time.sleep(wait_time)  # 指数退避 + 随机抖动
+                    # 指数退避 + 随机抖动，作用于全局令牌桶，并发的请求一起退避
+                    BUCKET.penalize(wait_time)
                 else:
                     print(f"错误获取 {ticker} 数据: {e}")
                     if attempt < max_retries - 1:
@@ -211,23 +482,13 @@ class YFinanceHelper:
         data = self.get_stock_data(ticker, start_date, end_date)
         
         if data is not None and not data.empty:
-            # 查找最接近目标日期的价格
-            target_date_str = target_date.strftime('%Y-%m-%d')
-            
-            # 尝试精确匹配
-            if target_date_str in data.index.strftime('%Y-%m-%d'):
-                return data.loc[data.index.strftime('%Y-%m-%d') == target_date_str, 'Close'].iloc[0]
-            
-            # 找最接近的日期
-            data['date_diff'] = abs((data.index - target_date).days)
-            closest_idx = data['date_diff'].idxmin()
-            return data.loc[closest_idx, 'Close']
+            return nearest_close(data, target_date, days_buffer)
         
         return None
     
     def batch_get_stock_data(self, tickers: List[str], start_date: str, end_date: str, 
                             batch_size: int = 10, delay_between_batches: float = 3.0,
-                            use_bulk_download: bool = True) -> Dict[str, pd.DataFrame]:
+                            use_bulk_download: bool = True, max_workers: int = 4) -> Dict[str, pd.DataFrame]:
         """
         批量获取股票数据
         
@@ -238,6 +499,7 @@ class YFinanceHelper:
             batch_size: 批处理大小
             delay_between_batches: 批次间延迟时间
             use_bulk_download: 是否使用yf.download的批量下载功能
+            max_workers: 逐个下载时的并发线程数
             
         Returns:
             股票代码到数据的字典
@@ -249,7 +511,8 @@ class YFinanceHelper:
             return self._batch_download_bulk(tickers, start_date, end_date, batch_size, delay_between_batches)
         else:
             # 逐个下载
-            return self._batch_download_individual(tickers, start_date, end_date, batch_size, delay_between_batches)
+            return self._batch_download_individual(tickers, start_date, end_date, batch_size, delay_between_batches,
+                                                   max_workers)
     
     def _batch_download_bulk(self, tickers: List[str], start_date: str, end_date: str,
                             batch_size: int, delay_between_batches: float) -> Dict[str, pd.DataFrame]:
@@ -262,12 +525,22 @@ class YFinanceHelper:
             print(f"\n批量下载批次 {i//batch_size + 1}: {batch}")
             
             try:
-                # 先检查缓存
+                # 先检查缓存：内存缓存全部命中时不访问缓存目录；
+                # 否则整批共用一次目录快照，文件读取在线程池中并行
                 cached_tickers = []
                 uncached_tickers = []
                 
-                for ticker in batch:
-                    cached_data = self._load_from_cache(ticker, start_date, end_date)
+                cached = [self._mem_cache_get((t, start_date, end_date)) for t in batch]
+                misses = [j for j, data in enumerate(cached) if data is None]
+                if misses:
+                    snapshot = self._scan_cache_dir()
+                    with ThreadPoolExecutor(max_workers=min(32, len(misses))) as executor:
+                        loaded = executor.map(
+                            lambda j: self._load_from_cache(batch[j], start_date, end_date, snapshot), misses)
+                        for j, data in zip(misses, loaded):
+                            cached[j] = data
+                
+                for ticker, cached_data in zip(batch, cached):
                     if cached_data is not None:
                         results[ticker] = cached_data
                         cached_tickers.append(ticker)
@@ -291,6 +564,7 @@ class YFinanceHelper:
                     }
                     
                     bulk_kwargs = self._get_download_kwargs(base_kwargs)
+                    BUCKET.acquire()
                     bulk_data = yf.download(uncached_tickers, **bulk_kwargs)
                     
                     if not bulk_data.empty:
@@ -298,15 +572,20 @@ class YFinanceHelper:
                         if len(uncached_tickers) == 1:
                             # 单个股票的情况
                             ticker = uncached_tickers[0]
+                            # group_by='ticker' 时单个股票也可能返回多级列
+                            if isinstance(bulk_data.columns, pd.MultiIndex) and \
+                                    ticker in bulk_data.columns.get_level_values(0):
+                                bulk_data = bulk_data[ticker]
                             results[ticker] = bulk_data
                             self._save_to_cache(ticker, start_date, end_date, bulk_data)
                             print(f"✅ {ticker}: {len(bulk_data)} 条记录")
                         else:
                             # 多个股票的情况
+                            top_level = set(bulk_data.columns.get_level_values(0))
                             for ticker in uncached_tickers:
                                 try:
-                                    if ticker in bulk_data.columns.levels[0]:
-                                        ticker_data = bulk_data[ticker]
+                                    if ticker in top_level:
+                                        ticker_data = bulk_data.xs(ticker, axis=1, level=0)
                                         if not ticker_data.empty:
                                             results[ticker] = ticker_data
                                             self._save_to_cache(ticker, start_date, end_date, ticker_data)
@@ -338,30 +617,75 @@ class YFinanceHelper:
         return results
     
     def _batch_download_individual(self, tickers: List[str], start_date: str, end_date: str,
-                                  batch_size: int, delay_between_batches: float) -> Dict[str, pd.DataFrame]:
-        """逐个下载（原有方法）"""
+                                  batch_size: int, delay_between_batches: float,
+                                  max_workers: int = 4) -> Dict[str, pd.DataFrame]:
+        """逐个下载（线程池并发，最多 max_workers 个请求同时进行）"""
         results = {}
         
-        # 分批处理
-        for i in range(0, len(tickers), batch_size):
-            batch = tickers[i:i + batch_size]
-            print(f"\n处理批次 {i//batch_size + 1}: {batch}")
-            
-            for ticker in batch:
-                data = self.get_stock_data(ticker, start_date, end_date)
-                if data is not None:
-                    results[ticker] = data
+        def fetch(ticker):
+            data = self.get_stock_data(ticker, start_date, end_date)
+            # 每个线程各自随机延迟，控制整体请求速率
+            self._random_delay()
+            return ticker, data
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # 分批处理
+            for i in range(0, len(tickers), batch_size):
+                batch = tickers[i:i + batch_size]
+                print(f"\n处理批次 {i//batch_size + 1}: {batch}")
                 
-                # 批次内延迟
-                self._random_delay()
-            
-            # 批次间延迟
-            if i + batch_size < len(tickers):
-                print(f"批次完成，等待 {delay_between_batches} 秒...")
-                time.sleep(delay_between_batches)
+                for ticker, data in executor.map(fetch, batch):
+                    if data is not None:
+                        results[ticker] = data
+                
+                # 批次间延迟
+                if i + batch_size < len(tickers):
+                    print(f"批次完成，等待 {delay_between_batches} 秒...")
+                    time.sleep(delay_between_batches)
         
         return results
     
+    async def batch_get_stock_data_async(self, tickers: List[str], start_date: str, end_date: str,
+                                         max_concurrency: int = 4) -> Dict[str, pd.DataFrame]:
+        """
+        并发逐个获取股票数据（asyncio）
+        
+        缓存读取和网络请求都放到工作线程中执行：命中缓存的股票解码时，未命中的股票已经在下载，
+        解码耗时被网络等待掩盖。网络请求最多 max_concurrency 个同时进行，
+        请求间的随机延迟用 asyncio.sleep，不阻塞事件循环。
+        
+        Args:
+            tickers: 股票代码列表
+            start_date: 开始日期
+            end_date: 结束日期
+            max_concurrency: 同时进行的请求数
+            
+        Returns:
+            股票代码到数据的字典
+        """
+        results = {t: self._mem_cache_get((t, start_date, end_date)) for t in tickers}
+        misses = [t for t, data in results.items() if data is None]
+        if not misses:  # 内存缓存全部命中，不访问缓存目录
+            return results
+        
+        snapshot = await asyncio.to_thread(self._scan_cache_dir)
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def load(ticker):
+            data = await asyncio.to_thread(self._load_from_cache, ticker, start_date, end_date, snapshot)
+            if data is not None:
+                return ticker, data
+            async with semaphore:
+                data = await asyncio.to_thread(self.get_stock_data, ticker, start_date, end_date,
+                                               snapshot=snapshot)
+                await asyncio.sleep(random.uniform(self.delay_min, self.delay_max))
+                return ticker, data
+        
+        for ticker, data in await asyncio.gather(*(load(ticker) for ticker in misses)):
+            results[ticker] = data
+        
+        return {t: data for t, data in results.items() if data is not None}
+    
     def clear_cache(self, older_than_days: int = 7):
         """
         清理缓存文件
@@ -373,16 +697,17 @@ class YFinanceHelper:
             return
         
         cutoff_time = time.time() - older_than_days * 24 * 3600
-        removed_count = 0
         
-        for filename in os.listdir(self.cache_dir):
-            if filename.endswith('.pkl'):
-                file_path = os.path.join(self.cache_dir, filename)
-                if os.path.getmtime(file_path) < cutoff_time:
-                    os.remove(file_path)
-                    removed_count += 1
+        # 一次 scandir 同时取得文件名和修改时间，删除操作在线程池中并行
+        with os.scandir(self.cache_dir) as entries:
+            victims = [entry.path for entry in entries
+                       if entry.name.endswith(('.feather', '.pkl')) and entry.stat().st_mtime < cutoff_time]
+        
+        if victims:
+            with ThreadPoolExecutor(max_workers=min(16, len(victims))) as executor:
+                list(executor.map(os.unlink, victims))
         
-        print(f"清理了 {removed_count} 个过期缓存文件")
+        print(f"清理了 {len(victims)} 个过期缓存文件")
 
 def demo_usage():
     """演示用法"""